@@ -0,0 +1,745 @@
+"""
+A local stand-in for the Box API used by the benchmarks
+
+Implements the subset of the folders, files, uploads, chunked uploads,
+downloads and zip downloads endpoints used by utils, with configurable
+per-request latency and per-connection bandwidth.
+Content is kept in memory.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import re
+import threading
+import time
+import zipfile
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from box_sdk_gen import BoxClient, BoxDeveloperTokenAuth
+from requests.adapters import HTTPAdapter
+from box_sdk_gen.networking.base_urls import BaseUrls
+from box_sdk_gen.networking.network import NetworkSession
+
+PART_SIZE = 8 * 1024 * 1024
+IO_CHUNK = 64 * 1024
+POOL_SIZE = 64
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S-00:00")
+
+
+class FakeBoxServer:
+    """in memory box api server"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        bandwidth: Optional[float] = None,
+        part_size: int = PART_SIZE,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.part_size = part_size
+        self.lock = threading.Lock()
+        self.items: Dict[str, dict] = {}
+        # parent id -> casefolded name -> item, box names are case insensitive
+        self.children: Dict[str, Dict[str, dict]] = {}
+        self.sessions: Dict[str, dict] = {}
+        self.zips: Dict[str, List[dict]] = {}
+        self.events: List[dict] = []
+        self.request_counts: Dict[str, int] = {}
+        self.latencies: List[float] = []
+        self._next_id = 1000
+        self._insert(self._new_item("folder", "0", "All Files", None))
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    # region server lifecycle
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeBoxServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeBoxServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def client(self) -> BoxClient:
+        """Returns a box sdk Client object pointed at this server"""
+        base_urls = BaseUrls(
+            base_url=self.base_url,
+            upload_url=self.base_url + "/api",
+            oauth_2_url=self.base_url + "/oauth2",
+        )
+        auth = BoxDeveloperTokenAuth(token="fake-token")
+        network_session = NetworkSession(base_urls=base_urls)
+        # room for the folder workers and their upload part workers
+        network_session.requests_session.mount("http://", HTTPAdapter(pool_maxsize=POOL_SIZE))
+        return BoxClient(auth, network_session=network_session)
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.request_counts = {}
+            self.latencies = []
+
+    def stats(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            counts = dict(self.request_counts)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+        return {"requests": sum(counts.values()), "by_route": counts, "p95_latency": p95}
+
+    # endregion
+
+    # region store
+
+    def _id(self) -> str:
+        self._next_id += 1
+        return str(self._next_id)
+
+    def _new_item(self, item_type: str, item_id: str, name: str, parent_id: Optional[str]) -> dict:
+        return {
+            "type": item_type,
+            "id": item_id,
+            "name": name,
+            "parent_id": parent_id,
+            "etag": "0",
+            "sequence_id": "0",
+            "size": 0,
+            "sha1": None,
+            "content": b"",
+            "version_id": None,
+            "created_at": _now(),
+            "modified_at": _now(),
+        }
+
+    def _insert(self, item: dict) -> None:
+        self.items[item["id"]] = item
+        if item["parent_id"] is not None:
+            self.children.setdefault(item["parent_id"], {})[item["name"].casefold()] = item
+
+    def _remove(self, item: dict) -> None:
+        del self.items[item["id"]]
+        if item["parent_id"] is not None:
+            del self.children[item["parent_id"]][item["name"].casefold()]
+
+    def _relocate(self, item: dict, parent_id: str, name: str) -> None:
+        self._remove(item)
+        item["parent_id"], item["name"] = parent_id, name
+        self._insert(item)
+
+    def _child(self, parent_id: str, name: str) -> Optional[dict]:
+        return self.children.get(parent_id, {}).get(name.casefold())
+
+    def _children(self, parent_id: str) -> List[dict]:
+        return list(self.children.get(parent_id, {}).values())
+
+    def _path(self, item: dict) -> List[dict]:
+        path = []
+        parent_id = item["parent_id"]
+        while parent_id is not None:
+            parent = self.items[parent_id]
+            path.insert(0, self._mini(parent))
+            parent_id = parent["parent_id"]
+        return path
+
+    def _mini(self, item: dict) -> dict:
+        mini = {"type": item["type"], "id": item["id"], "etag": item["etag"], "name": item["name"]}
+        mini["sequence_id"] = item["sequence_id"]
+        if item["type"] == "file":
+            mini["sha1"] = item["sha1"]
+            mini["file_version"] = {"type": "file_version", "id": item["version_id"], "sha1": item["sha1"]}
+        return mini
+
+    def _full(self, item: dict, fields: Optional[List[str]] = None) -> dict:
+        full = self._mini(item)
+        full.update(
+            {
+                "size": item["size"] if item["type"] == "file" else self._folder_size(item["id"]),
+                "created_at": item["created_at"],
+                "modified_at": item["modified_at"],
+                "content_created_at": item["created_at"],
+                "content_modified_at": item["modified_at"],
+                "description": "",
+                "path_collection": {"total_count": len(self._path(item)), "entries": self._path(item)},
+                "owned_by": {"type": "user", "id": "1", "name": "Fake User", "login": "fake@example.com"},
+                "item_status": "active",
+            }
+        )
+        if item["parent_id"] is not None:
+            full["parent"] = self._mini(self.items[item["parent_id"]])
+        if fields:
+            keep = {"type", "id", "etag"} | set(fields)
+            full = {key: value for key, value in full.items() if key in keep}
+        return full
+
+    def _folder_size(self, folder_id: str) -> int:
+        return sum(
+            item["size"] if item["type"] == "file" else self._folder_size(item["id"])
+            for item in self._children(folder_id)
+        )
+
+    def _set_content(self, item: dict, content: bytes) -> None:
+        item["content"] = content
+        item["size"] = len(content)
+        item["sha1"] = hashlib.sha1(content).hexdigest()
+        item["version_id"] = self._id()
+        item["etag"] = str(int(item["etag"]) + 1)
+        item["modified_at"] = _now()
+
+    def _event(self, event_type: str, item: dict) -> None:
+        self.events.append(
+            {"type": "event", "event_id": self._id(), "event_type": event_type, "source": self._full(item)}
+        )
+
+    def add_file(self, parent_id: str, name: str, content: bytes) -> dict:
+        """create a file directly in the store"""
+        with self.lock:
+            item = self._new_item("file", self._id(), name, parent_id)
+            self._set_content(item, content)
+            self._insert(item)
+            self._event("ITEM_UPLOAD", item)
+            return item
+
+    def add_folder(self, parent_id: str, name: str) -> dict:
+        """create a folder directly in the store"""
+        with self.lock:
+            item = self._new_item("folder", self._id(), name, parent_id)
+            self._insert(item)
+            self._event("ITEM_CREATE", item)
+            return item
+
+    # endregion
+
+
+class _StreamedZipBuffer(io.RawIOBase):
+    """a write only buffer zipfile cannot seek in
+
+    Like a zip written to the network, every entry then carries a data
+    descriptor after its data instead of sizes in its header.
+    """
+
+    def __init__(self) -> None:
+        self.data = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.data += data
+        return len(data)
+
+    def getvalue(self) -> bytes:
+        return bytes(self.data)
+
+
+class _BoxError(Exception):
+    def __init__(self, status: int, code: str, context_info: Optional[dict] = None) -> None:
+        super().__init__(code)
+        self.status = status
+        self.code = code
+        self.context_info = context_info
+
+
+def _make_handler(server: FakeBoxServer):
+    routes = []
+
+    def route(method: str, pattern: str):
+        def register(func):
+            routes.append((method, re.compile(pattern + "$"), func))
+            return func
+
+        return register
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # keep delayed acks from adding 40ms to every keep-alive request
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args) -> None:
+            pass
+
+        # region plumbing
+
+        def _throttle(self, size: int) -> None:
+            if server.bandwidth:
+                time.sleep(size / server.bandwidth)
+
+        def _body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            buffer = io.BytesIO()
+            while length > 0:
+                chunk = self.rfile.read(min(IO_CHUNK, length))
+                if not chunk:
+                    break
+                self._throttle(len(chunk))
+                buffer.write(chunk)
+                length -= len(chunk)
+            return buffer.getvalue()
+
+        def _json_body(self) -> dict:
+            body = self._body()
+            return json.loads(body) if body else {}
+
+        def _send(self, status: int, payload=None, headers: Optional[Dict[str, str]] = None) -> None:
+            body = b"" if payload is None else json.dumps(payload).encode()
+            self._send_bytes(status, body, "application/json", headers)
+
+        def _send_bytes(self, status: int, body: bytes, content_type: str, headers=None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            for start in range(0, len(body), IO_CHUNK):
+                chunk = body[start : start + IO_CHUNK]
+                self._throttle(len(chunk))
+                self.wfile.write(chunk)
+
+        def _dispatch(self, method: str) -> None:
+            started = time.perf_counter()
+            parsed = urlparse(self.path)
+            self.query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+            for route_method, pattern, func in routes:
+                match = pattern.match(parsed.path)
+                if route_method == method and match:
+                    name = f"{method} {pattern.pattern[:-1]}"
+                    break
+            else:
+                self._body()
+                self._send(404, {"type": "error", "status": 404, "code": "not_found"})
+                return
+            if server.latency:
+                time.sleep(server.latency)
+            try:
+                func(self, *match.groups())
+            except _BoxError as err:
+                payload = {"type": "error", "status": err.status, "code": err.code, "message": err.code}
+                if err.context_info is not None:
+                    payload["context_info"] = err.context_info
+                self._send(err.status, payload)
+            with server.lock:
+                server.request_counts[name] = server.request_counts.get(name, 0) + 1
+                server.latencies.append(time.perf_counter() - started)
+
+        def do_GET(self) -> None:
+            self._dispatch("GET")
+
+        def do_POST(self) -> None:
+            self._dispatch("POST")
+
+        def do_PUT(self) -> None:
+            self._dispatch("PUT")
+
+        def do_DELETE(self) -> None:
+            self._dispatch("DELETE")
+
+        def do_OPTIONS(self) -> None:
+            self._dispatch("OPTIONS")
+
+        def _fields(self) -> Optional[List[str]]:
+            fields = self.query.get("fields")
+            return fields.split(",") if fields else None
+
+        def _multipart(self) -> Dict[str, bytes]:
+            boundary = re.search(r"boundary=([^;]+)", self.headers["Content-Type"]).group(1).strip('"')
+            parts = {}
+            for chunk in self._body().split(b"--" + boundary.encode()):
+                if b"\r\n\r\n" not in chunk:
+                    continue
+                head, _, data = chunk.partition(b"\r\n\r\n")
+                name = re.search(rb'name="([^"]+)"', head).group(1).decode()
+                parts[name] = data[:-2] if data.endswith(b"\r\n") else data
+            return parts
+
+        # endregion
+
+        # region folders
+
+        @route("GET", r"/2.0/folders/(\w+)")
+        def get_folder(self, folder_id: str) -> None:
+            with server.lock:
+                folder = _get(folder_id, "folder")
+                self._send(200, server._full(folder, self._fields()))
+
+        @route("GET", r"/2.0/folders/(\w+)/items")
+        def get_folder_items(self, folder_id: str) -> None:
+            fields = self._fields()
+            limit = min(int(self.query.get("limit", 100)), 1000)
+            with server.lock:
+                _get(folder_id, "folder")
+                children = sorted(
+                    server._children(folder_id), key=lambda item: (item["type"] != "folder", int(item["id"]))
+                )
+                entries = [server._full(item, fields or ["name", "sha1", "file_version"]) for item in children]
+            if self.query.get("usemarker", "").lower() == "true":
+                start = int(self.query.get("marker") or 0)
+                page = entries[start : start + limit]
+                next_marker = str(start + limit) if start + limit < len(entries) else None
+                self._send(200, {"entries": page, "limit": limit, "next_marker": next_marker})
+            else:
+                offset = int(self.query.get("offset", 0))
+                page = entries[offset : offset + limit]
+                self._send(200, {"entries": page, "limit": limit, "offset": offset, "total_count": len(entries)})
+
+        @route("POST", r"/2.0/folders")
+        def create_folder(self) -> None:
+            body = self._json_body()
+            with server.lock:
+                parent_id = body["parent"]["id"]
+                _get(parent_id, "folder")
+                conflict = server._child(parent_id, body["name"])
+                if conflict:
+                    raise _BoxError(409, "item_name_in_use", {"conflicts": [server._mini(conflict)]})
+                folder = server._new_item("folder", server._id(), body["name"], parent_id)
+                server._insert(folder)
+                server._event("ITEM_CREATE", folder)
+                self._send(201, server._full(folder))
+
+        @route("POST", r"/2.0/folders/(\w+)/copy")
+        def copy_folder(self, folder_id: str) -> None:
+            body = self._json_body()
+            with server.lock:
+                source = _get(folder_id, "folder")
+                parent_id = body["parent"]["id"]
+                name = body.get("name") or source["name"]
+                conflict = server._child(parent_id, name)
+                if conflict:
+                    raise _BoxError(409, "item_name_in_use", {"conflicts": server._mini(conflict)})
+                copy = _copy_tree(source, parent_id, name)
+                self._send(201, server._full(copy))
+
+        @route("PUT", r"/2.0/folders/(\w+)")
+        def update_folder(self, folder_id: str) -> None:
+            self._update(folder_id, "folder")
+
+        @route("DELETE", r"/2.0/folders/(\w+)")
+        def delete_folder(self, folder_id: str) -> None:
+            with server.lock:
+                folder = _get(folder_id, "folder")
+                if server._children(folder_id) and self.query.get("recursive", "").lower() != "true":
+                    raise _BoxError(400, "folder_not_empty")
+                _delete_tree(folder)
+            self._send(204)
+
+        # endregion
+
+        # region files
+
+        @route("GET", r"/2.0/files/(\w+)")
+        def get_file(self, file_id: str) -> None:
+            with server.lock:
+                self._send(200, server._full(_get(file_id, "file"), self._fields()))
+
+        @route("PUT", r"/2.0/files/(\w+)")
+        def update_file(self, file_id: str) -> None:
+            self._update(file_id, "file")
+
+        def _update(self, item_id: str, item_type: str) -> None:
+            body = self._json_body()
+            with server.lock:
+                item = _get(item_id, item_type)
+                parent_id = (body.get("parent") or {}).get("id", item["parent_id"])
+                name = body.get("name", item["name"])
+                conflict = server._child(parent_id, name)
+                if conflict and conflict is not item:
+                    raise _BoxError(409, "item_name_in_use", {"conflicts": server._mini(conflict)})
+                moved = parent_id != item["parent_id"]
+                server._relocate(item, parent_id, name)
+                item["etag"] = str(int(item["etag"]) + 1)
+                server._event("ITEM_MOVE" if moved else "ITEM_RENAME", item)
+                self._send(200, server._full(item))
+
+        @route("DELETE", r"/2.0/files/(\w+)")
+        def delete_file(self, file_id: str) -> None:
+            with server.lock:
+                _delete_tree(_get(file_id, "file"))
+            self._send(204)
+
+        @route("POST", r"/2.0/files/(\w+)/copy")
+        def copy_file(self, file_id: str) -> None:
+            body = self._json_body()
+            with server.lock:
+                source = _get(file_id, "file")
+                parent_id = body["parent"]["id"]
+                name = body.get("name") or source["name"]
+                conflict = server._child(parent_id, name)
+                if conflict:
+                    raise _BoxError(409, "item_name_in_use", {"conflicts": server._mini(conflict)})
+                copy = _copy_tree(source, parent_id, name)
+                self._send(201, server._full(copy))
+
+        @route("GET", r"/2.0/files/(\w+)/content")
+        def download_file(self, file_id: str) -> None:
+            with server.lock:
+                content = _get(file_id, "file")["content"]
+            byte_range = self.headers.get("Range")
+            if byte_range:
+                start, _, end = byte_range.split("=", 1)[1].partition("-")
+                start, end = int(start), int(end) if end else len(content) - 1
+                end = min(end, len(content) - 1)
+                headers = {"Content-Range": f"bytes {start}-{end}/{len(content)}", "Accept-Ranges": "bytes"}
+                self._send_bytes(206, content[start : end + 1], "application/octet-stream", headers)
+            else:
+                self._send_bytes(200, content, "application/octet-stream", {"Accept-Ranges": "bytes"})
+
+        @route("OPTIONS", r"/2.0/files/content")
+        def preflight(self) -> None:
+            body = self._json_body()
+            with server.lock:
+                conflict = server._child(body["parent"]["id"], body["name"])
+                if conflict:
+                    raise _BoxError(409, "item_name_in_use", {"conflicts": server._mini(conflict)})
+            self._send(200, {"upload_url": server.base_url + "/api/2.0/files/content", "upload_token": None})
+
+        # endregion
+
+        # region uploads
+
+        @route("POST", r"/api/2.0/files/content")
+        def upload_file(self) -> None:
+            parts = self._multipart()
+            attributes = json.loads(parts["attributes"])
+            with server.lock:
+                parent_id = attributes["parent"]["id"]
+                conflict = server._child(parent_id, attributes["name"])
+                if conflict:
+                    raise _BoxError(409, "item_name_in_use", {"conflicts": server._mini(conflict)})
+                file = server._new_item("file", server._id(), attributes["name"], parent_id)
+                server._set_content(file, parts["file"])
+                server._insert(file)
+                server._event("ITEM_UPLOAD", file)
+                self._send(201, {"total_count": 1, "entries": [server._full(file)]})
+
+        @route("POST", r"/api/2.0/files/(\w+)/content")
+        def upload_file_version(self, file_id: str) -> None:
+            parts = self._multipart()
+            with server.lock:
+                file = _get(file_id, "file")
+                server._set_content(file, parts["file"])
+                server._event("ITEM_UPLOAD", file)
+                self._send(201, {"total_count": 1, "entries": [server._full(file)]})
+
+        @route("POST", r"/api/2.0/files/upload_sessions")
+        def create_upload_session(self) -> None:
+            self._create_session(self._json_body())
+
+        @route("POST", r"/api/2.0/files/(\w+)/upload_sessions")
+        def create_upload_session_for_file(self, file_id: str) -> None:
+            body = self._json_body()
+            with server.lock:
+                file = _get(file_id, "file")
+            body.update({"file_id": file_id, "folder_id": file["parent_id"]})
+            body.setdefault("file_name", file["name"])
+            self._create_session(body)
+
+        def _create_session(self, body: dict) -> None:
+            with server.lock:
+                if "file_id" not in body and server._child(body["folder_id"], body["file_name"]):
+                    conflict = server._child(body["folder_id"], body["file_name"])
+                    raise _BoxError(409, "item_name_in_use", {"conflicts": server._mini(conflict)})
+                session_id = "S" + server._id()
+                total_parts = -(-body["file_size"] // server.part_size)
+                server.sessions[session_id] = {"body": body, "parts": {}}
+            self._send(201, _session(session_id, total_parts, 0))
+
+        @route("GET", r"/api/2.0/files/upload_sessions/(\w+)")
+        def get_upload_session(self, session_id: str) -> None:
+            with server.lock:
+                session = _get_session(session_id)
+                total_parts = -(-session["body"]["file_size"] // server.part_size)
+                self._send(200, _session(session_id, total_parts, len(session["parts"])))
+
+        @route("PUT", r"/api/2.0/files/upload_sessions/(\w+)")
+        def upload_part(self, session_id: str) -> None:
+            data = self._body()
+            match = re.match(r"bytes (\d+)-(\d+)/(\d+)", self.headers["Content-Range"])
+            offset = int(match.group(1))
+            digest = base64.b64encode(hashlib.sha1(data).digest()).decode()
+            if self.headers.get("Digest") != "sha=" + digest:
+                raise _BoxError(400, "digest_mismatch")
+            part = {
+                "part_id": f"{offset:08X}",
+                "offset": offset,
+                "size": len(data),
+                "sha1": hashlib.sha1(data).hexdigest(),
+            }
+            with server.lock:
+                _get_session(session_id)["parts"][offset] = (part, data)
+            self._send(200, {"part": part})
+
+        @route("GET", r"/api/2.0/files/upload_sessions/(\w+)/parts")
+        def list_parts(self, session_id: str) -> None:
+            offset = int(self.query.get("offset", 0))
+            limit = int(self.query.get("limit", 100))
+            with server.lock:
+                parts = [
+                    part for part, _ in sorted(_get_session(session_id)["parts"].values(), key=lambda p: p[0]["offset"])
+                ]
+            page = parts[offset : offset + limit]
+            self._send(200, {"entries": page, "total_count": len(parts), "offset": offset, "limit": limit})
+
+        @route("POST", r"/api/2.0/files/upload_sessions/(\w+)/commit")
+        def commit(self, session_id: str) -> None:
+            body = self._json_body()
+            with server.lock:
+                session = _get_session(session_id)
+                stored = session["parts"]
+                offsets = [part["offset"] for part in body["parts"]]
+                if sorted(offsets) != sorted(stored):
+                    raise _BoxError(400, "missing_parts")
+                content = b"".join(stored[offset][1] for offset in sorted(offsets))
+                expected = base64.b64encode(hashlib.sha1(content).digest()).decode()
+                if self.headers.get("Digest") != "sha=" + expected:
+                    raise _BoxError(400, "digest_mismatch")
+                session_body = session["body"]
+                if "file_id" in session_body:
+                    file = server.items[session_body["file_id"]]
+                else:
+                    file = server._new_item("file", server._id(), session_body["file_name"], session_body["folder_id"])
+                    server._insert(file)
+                server._set_content(file, content)
+                server._event("ITEM_UPLOAD", file)
+                del server.sessions[session_id]
+                self._send(201, {"total_count": 1, "entries": [server._full(file)]})
+
+        @route("DELETE", r"/api/2.0/files/upload_sessions/(\w+)")
+        def abort_session(self, session_id: str) -> None:
+            with server.lock:
+                server.sessions.pop(session_id, None)
+            self._send(204)
+
+        # endregion
+
+        # region zip downloads and events
+
+        @route("POST", r"/2.0/zip_downloads")
+        def create_zip_download(self) -> None:
+            body = self._json_body()
+            with server.lock:
+                zip_id = "Z" + server._id()
+                server.zips[zip_id] = body["items"]
+            self._send(
+                202,
+                {
+                    "download_url": f"{server.base_url}/zip/{zip_id}/content",
+                    "status_url": f"{server.base_url}/zip/{zip_id}/status",
+                    "name_conflicts": [],
+                },
+            )
+
+        @route("GET", r"/zip/(\w+)/content")
+        def get_zip_content(self, zip_id: str) -> None:
+            buffer = _StreamedZipBuffer()
+            with server.lock, zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                for entry in server.zips[zip_id]:
+                    _zip_item(archive, server.items[entry["id"]], "")
+            self._send_bytes(200, buffer.getvalue(), "application/zip")
+
+        @route("GET", r"/zip/(\w+)/status")
+        def get_zip_status(self, zip_id: str) -> None:
+            with server.lock:
+                total = len(server.zips[zip_id])
+            self._send(
+                200,
+                {
+                    "total_file_count": total,
+                    "downloaded_file_count": total,
+                    "skipped_file_count": 0,
+                    "skipped_folder_count": 0,
+                    "state": "succeeded",
+                },
+            )
+
+        @route("GET", r"/2.0/events")
+        def get_events(self) -> None:
+            with server.lock:
+                position = self.query.get("stream_position")
+                start = len(server.events) if position == "now" else int(position or 0)
+                limit = int(self.query.get("limit", 100))
+                page = server.events[start : start + limit]
+                self._send(
+                    200, {"entries": page, "chunk_size": len(page), "next_stream_position": str(start + len(page))}
+                )
+
+        # endregion
+
+    def _get(item_id: str, item_type: str) -> dict:
+        item = server.items.get(item_id)
+        if item is None or item["type"] != item_type:
+            raise _BoxError(404, "not_found")
+        return item
+
+    def _get_session(session_id: str) -> dict:
+        session = server.sessions.get(session_id)
+        if session is None:
+            raise _BoxError(404, "not_found")
+        return session
+
+    def _session(session_id: str, total_parts: int, processed: int) -> dict:
+        endpoint = f"{server.base_url}/api/2.0/files/upload_sessions/{session_id}"
+        return {
+            "type": "upload_session",
+            "id": session_id,
+            "part_size": server.part_size,
+            "total_parts": total_parts,
+            "num_parts_processed": processed,
+            "session_endpoints": {
+                "upload_part": endpoint,
+                "commit": endpoint + "/commit",
+                "abort": endpoint,
+                "list_parts": endpoint + "/parts",
+                "status": endpoint,
+            },
+        }
+
+    def _copy_tree(source: dict, parent_id: str, name: str) -> dict:
+        copy = dict(source, id=server._id(), name=name, parent_id=parent_id, created_at=_now())
+        server._insert(copy)
+        server._event("ITEM_COPY", copy)
+        if source["type"] == "folder":
+            for child in server._children(source["id"]):
+                _copy_tree(child, copy["id"], child["name"])
+        return copy
+
+    def _delete_tree(item: dict) -> None:
+        for child in server._children(item["id"]):
+            _delete_tree(child)
+        server._remove(item)
+        server._event("ITEM_TRASH", item)
+
+    def _zip_item(archive: zipfile.ZipFile, item: dict, prefix: str) -> None:
+        if item["type"] == "file":
+            if item["content"]:
+                archive.writestr(prefix + item["name"], item["content"])
+            else:
+                # empty files and folders are stored, not deflated
+                archive.writestr(zipfile.ZipInfo(prefix + item["name"]), b"")
+        else:
+            archive.writestr(zipfile.ZipInfo(prefix + item["name"] + "/"), b"")
+            for child in server._children(item["id"]):
+                _zip_item(archive, child, prefix + item["name"] + "/")
+
+    return Handler
@@ -0,0 +1,89 @@
+"""
+Payload size of the field profiles against a local fake Box server
+
+Lists a large folder and gets a file with every profile in utils.box_fields,
+and reports response bytes, and the seconds to fetch and parse the result
+with the SDK.
+
+Usage, from the repository root:
+    python -m benchmarks.field_profiles --items 5000
+"""
+
+import argparse
+import json
+import logging
+import time
+from typing import List
+
+import requests
+
+from benchmarks.fake_box_server import FakeBoxServer
+from utils.box_fields import FIELD_PROFILES, profile_fields
+from utils.box_listing import iter_folder_items
+
+logging.basicConfig(level=logging.WARNING)
+logging.getLogger("box_sdk_gen").setLevel(logging.CRITICAL)
+
+
+def payload_bytes(server: FakeBoxServer, path: str, fields) -> int:
+    """bytes of one response body, straight from the wire"""
+    params = {"fields": ",".join(fields)} if fields else {}
+    if path.endswith("/items"):
+        params.update({"limit": 1000, "usemarker": "true"})
+    response = requests.get(server.base_url + path, params=params, timeout=30)
+    response.raise_for_status()
+    return len(response.content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=5000, help="files in the listed folder")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = parser.parse_args()
+
+    rows: List[dict] = []
+    with FakeBoxServer(latency=0.0) as server:
+        client = server.client()
+        folder_id = server.add_folder("0", "profiles")["id"]
+        for index in range(args.items):
+            file_id = server.add_file(folder_id, f"file_{index:06}.txt", b"x" * 64)["id"]
+
+        for profile in FIELD_PROFILES:
+            fields = profile_fields(profile)
+            started = time.perf_counter()
+            count = sum(1 for _ in iter_folder_items(client, folder_id, fields=fields))
+            list_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            client.files.get_file_by_id(file_id, fields=fields)
+            get_seconds = time.perf_counter() - started
+
+            rows.append(
+                {
+                    "profile": profile,
+                    "items": count,
+                    "page_bytes": payload_bytes(server, f"/2.0/folders/{folder_id}/items", fields),
+                    "list_seconds": list_seconds,
+                    "file_bytes": payload_bytes(server, f"/2.0/files/{file_id}", fields),
+                    "get_ms": get_seconds * 1000,
+                }
+            )
+
+    full = next(row for row in rows if row["profile"] == "full")
+    header = f"{'profile':<8} {'page bytes':>11} {'vs full':>8} {'list sec':>9} {'file bytes':>11} {'vs full':>8} {'get ms':>7}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['profile']:<8} {row['page_bytes']:>11} {row['page_bytes'] / full['page_bytes']:>8.0%} "
+            f"{row['list_seconds']:>9.2f} {row['file_bytes']:>11} {row['file_bytes'] / full['file_bytes']:>8.0%} "
+            f"{row['get_ms']:>7.1f}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as json_file:
+            json.dump(rows, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
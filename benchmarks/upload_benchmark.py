@@ -0,0 +1,140 @@
+"""
+Upload throughput benchmarks against a local fake Box server
+
+Runs folder_upload and folder_upload_concurrent over generated small-file,
+large-file and mixed trees, and reports files/sec, MB/s, request counts
+and p95 server latency.
+
+Usage, from the repository root:
+    python -m benchmarks.upload_benchmark --latency 0.05 --bandwidth 5000000
+"""
+
+import argparse
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.fake_box_server import FakeBoxServer
+from utils.box_utils import CHUNKED_UPLOAD_THRESHOLD, create_box_folder, folder_upload, folder_upload_concurrent
+
+logging.basicConfig(level=logging.WARNING)
+logging.getLogger("box_sdk_gen").setLevel(logging.CRITICAL)
+
+MB = 1024 * 1024
+
+
+def make_tree(base: pathlib.Path, folders: int, files_per_folder: int, file_size: int) -> None:
+    """generate a local tree of random files"""
+    for folder_index in range(folders):
+        folder = base / f"folder_{folder_index:03}"
+        folder.mkdir(parents=True, exist_ok=True)
+        for file_index in range(files_per_folder):
+            (folder / f"file_{file_index:04}.bin").write_bytes(os.urandom(file_size))
+
+
+def make_scenarios(scale: float) -> Dict[str, Callable[[pathlib.Path], None]]:
+    small_files = max(1, int(100 * scale))
+    large_size = CHUNKED_UPLOAD_THRESHOLD + 4 * MB
+
+    def small(base: pathlib.Path) -> None:
+        make_tree(base, 10, small_files, 4 * 1024)
+
+    def large(base: pathlib.Path) -> None:
+        make_tree(base, 1, max(1, int(2 * scale)), large_size)
+
+    def mixed(base: pathlib.Path) -> None:
+        make_tree(base / "small", 5, small_files, 4 * 1024)
+        make_tree(base / "medium", 2, max(1, int(10 * scale)), 2 * MB)
+        make_tree(base / "large", 1, 1, large_size)
+
+    return {"small": small, "large": large, "mixed": mixed}
+
+
+def tree_stats(base: pathlib.Path) -> Dict[str, int]:
+    files = [path for path in base.rglob("*") if path.is_file()]
+    return {"files": len(files), "bytes": sum(path.stat().st_size for path in files)}
+
+
+def run_mode(server: FakeBoxServer, mode: str, local_path: str, workers: int, manifest_path: str) -> float:
+    """upload the tree once and return the elapsed seconds"""
+    client = server.client()
+    base_folder = create_box_folder(client, f"bench_{mode}", client.folders.get_folder_by_id("0"))
+    server.reset_stats()
+    started = time.perf_counter()
+    if mode == "sequential":
+        folder_upload(client, base_folder, local_path)
+    elif mode == "concurrent":
+        results = folder_upload_concurrent(client, base_folder, local_path, max_workers=workers)
+        failures = [result for result in results if not result.ok]
+        if failures:
+            logging.warning("%s failures, first: %s", len(failures), failures[0])
+    elif mode == "resync":
+        # the first pass fills the manifest, only the second one is measured
+        folder_upload_concurrent(client, base_folder, local_path, max_workers=workers, manifest_path=manifest_path)
+        server.reset_stats()
+        started = time.perf_counter()
+        folder_upload_concurrent(client, base_folder, local_path, max_workers=workers, manifest_path=manifest_path)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["small", "large", "mixed", "all"], default="all")
+    parser.add_argument("--modes", default="sequential,concurrent,resync", help="comma separated upload modes")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every request")
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes per second per connection")
+    parser.add_argument("--part-size", type=int, default=8 * MB, help="upload session part size")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the number of files")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = parser.parse_args()
+
+    scenarios = make_scenarios(args.scale)
+    names = list(scenarios) if args.scenario == "all" else [args.scenario]
+    rows: List[dict] = []
+
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_path = pathlib.Path(tmp_dir) / name
+            scenarios[name](local_path)
+            totals = tree_stats(local_path)
+            for mode in args.modes.split(","):
+                with FakeBoxServer(args.latency, args.bandwidth, args.part_size) as server:
+                    elapsed = run_mode(
+                        server, mode, str(local_path), args.workers, str(pathlib.Path(tmp_dir) / "m.json")
+                    )
+                    stats = server.stats()
+                rows.append(
+                    {
+                        "scenario": name,
+                        "mode": mode,
+                        "files": totals["files"],
+                        "mb": totals["bytes"] / MB,
+                        "seconds": elapsed,
+                        "files_per_sec": totals["files"] / elapsed,
+                        "mb_per_sec": totals["bytes"] / MB / elapsed,
+                        "requests": stats["requests"],
+                        "p95_latency_ms": stats["p95_latency"] * 1000,
+                    }
+                )
+
+    header = f"{'scenario':<8} {'mode':<11} {'files':>6} {'MB':>8} {'sec':>8} {'files/s':>8} {'MB/s':>8} {'reqs':>6} {'p95 ms':>7}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['scenario']:<8} {row['mode']:<11} {row['files']:>6} {row['mb']:>8.1f} {row['seconds']:>8.2f} "
+            f"{row['files_per_sec']:>8.1f} {row['mb_per_sec']:>8.1f} {row['requests']:>6} {row['p95_latency_ms']:>7.1f}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as json_file:
+            json.dump(rows, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
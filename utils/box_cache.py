@@ -0,0 +1,276 @@
+"""
+Local download cache for box files
+content addressed by sha1, with a byte budget and least recently used eviction
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from box_sdk_gen.client import BoxClient as Client
+
+from utils.box_state import write_json_atomic
+from utils.box_throttle import Priority, ThrottledReader, copy_stream
+from utils.box_utils import file_sha1
+
+logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = ".box_download_cache"
+DEFAULT_CACHE_BYTES = 1024 * 1024 * 1024
+INDEX_FILE = "index.json"
+
+
+class DownloadCache:
+    """on disk cache in front of client.downloads.download_file
+
+    Content is stored once per sha1, file id plus version id point at it.
+    Reads with a known version id or sha1 need no request at all, reads of
+    the current version cost one metadata request. Files are written to a
+    temporary file and moved into place, so a blob is either whole or absent.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_BYTES) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # sha1 -> size, least recently used first
+        self._blobs: "OrderedDict[str, int]" = OrderedDict()
+        # "file_id:version_id" -> sha1
+        self._versions: Dict[str, str] = {}
+        self._downloading: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return sum(self._blobs.values())
+
+    def _blob_path(self, sha1: str) -> str:
+        return os.path.join(self.cache_dir, sha1[:2], sha1)
+
+    def _load(self) -> None:
+        """rebuild the lru order from the blob modification times"""
+        blobs = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir():
+                continue
+            for blob in os.scandir(entry.path):
+                if blob.name.startswith("."):
+                    # temporary file of an interrupted download
+                    os.remove(blob.path)
+                    continue
+                stat = blob.stat()
+                blobs.append((stat.st_mtime, blob.name, stat.st_size))
+        for _, sha1, size in sorted(blobs):
+            self._blobs[sha1] = size
+
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), "r", encoding="utf-8") as index_file:
+                versions = json.load(index_file)
+        except (OSError, ValueError):
+            versions = {}
+        self._versions = {key: sha1 for key, sha1 in versions.items() if sha1 in self._blobs}
+
+    def _save_index(self) -> None:
+        write_json_atomic(os.path.join(self.cache_dir, INDEX_FILE), self._versions)
+
+    def _open_blob(self, sha1: str) -> Optional[BinaryIO]:
+        """open a cached blob and mark it recently used, None when not cached
+
+        Blobs are opened and evicted under the lock, and an open handle stays
+        readable after its blob is evicted, so readers never lose a blob.
+        """
+        with self._lock:
+            if sha1 not in self._blobs:
+                return None
+            try:
+                blob = open(self._blob_path(sha1), "rb")
+            except FileNotFoundError:
+                self._blobs.pop(sha1, None)
+                return None
+            self._blobs.move_to_end(sha1)
+        try:
+            os.utime(blob.name)
+        except OSError:
+            pass
+        return blob
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _evict(self, needed: int) -> None:
+        """drop least recently used blobs until needed bytes fit, lock held"""
+        total = sum(self._blobs.values())
+        while self._blobs and total + needed > self.max_bytes:
+            sha1, size = self._blobs.popitem(last=False)
+            total -= size
+            try:
+                os.remove(self._blob_path(sha1))
+            except OSError:
+                # already gone, or still open where open files cannot be removed
+                pass
+            logging.debug(" Evicted %s from the download cache", sha1)
+        self._versions = {key: value for key, value in self._versions.items() if value in self._blobs}
+
+    def _store(self, client: Client, file_id: str, version_id: str, sha1: str, priority: Priority) -> BinaryIO:
+        """download a version into the cache and return the opened blob"""
+
+        blob_dir = os.path.dirname(self._blob_path(sha1))
+        os.makedirs(blob_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".", dir=blob_dir)
+        try:
+            stream = client.downloads.download_file(file_id, version=version_id)
+            with os.fdopen(fd, "wb") as tmp_file:
+                copy_stream(stream, tmp_file, priority)
+            size = os.path.getsize(tmp_path)
+            local_sha1 = file_sha1(tmp_path)
+            if local_sha1 != sha1:
+                raise ValueError(f"Downloaded file {file_id} sha1 {local_sha1} does not match {sha1}")
+            with self._lock:
+                self._evict(size)
+                os.replace(tmp_path, self._blob_path(sha1))
+                self._blobs[sha1] = size
+                return open(self._blob_path(sha1), "rb")
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _resolve(self, client: Client, file_id: str, version_id: Optional[str]) -> Tuple[str, str, int]:
+        """(version_id, sha1, size) of the requested version"""
+        if version_id is None:
+            file = client.files.get_file_by_id(file_id, fields=["sha1", "size", "file_version"])
+            return file.file_version.id, file.sha_1, file.size
+        version = client.file_versions.get_file_version_by_id(file_id, version_id, fields=["sha1", "size"])
+        return version_id, version.sha_1, version.size
+
+    def _open_version(
+        self,
+        client: Client,
+        file_id: str,
+        version_id: Optional[str],
+        sha1: Optional[str],
+        priority: Priority,
+    ) -> Optional[BinaryIO]:
+        """opened blob with the content of a file version, downloaded on a miss
+
+        Returns None for files larger than the whole cache.
+        """
+
+        if sha1 is not None:
+            blob = self._open_blob(sha1)
+            if blob is not None:
+                self._count(hit=True)
+                return blob
+        if version_id is not None:
+            with self._lock:
+                known_sha1 = self._versions.get(f"{file_id}:{version_id}")
+            blob = self._open_blob(known_sha1) if known_sha1 else None
+            if blob is not None:
+                self._count(hit=True)
+                return blob
+
+        version_id, sha1, size = self._resolve(client, file_id, version_id)
+        if size is not None and size > self.max_bytes:
+            return None
+
+        with self._lock:
+            # one download per sha1, concurrent readers wait for it
+            download_lock = self._downloading.setdefault(sha1, threading.Lock())
+
+        try:
+            with download_lock:
+                blob = self._open_blob(sha1)
+                self._count(hit=blob is not None)
+                if blob is None:
+                    blob = self._store(client, file_id, version_id, sha1, priority)
+        finally:
+            with self._lock:
+                self._downloading.pop(sha1, None)
+        with self._lock:
+            self._versions[f"{file_id}:{version_id}"] = sha1
+            self._save_index()
+        return blob
+
+    def get_path(
+        self,
+        client: Client,
+        file_id: str,
+        version_id: Optional[str] = None,
+        sha1: Optional[str] = None,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> Optional[str]:
+        """local path holding the content of a file version
+
+        Without a version id the current version is used. Returns None for
+        files larger than the whole cache, read those with open instead.
+        A concurrent download into the cache can evict the path, jobs that
+        share a cache should use open or download.
+        """
+
+        blob = self._open_version(client, file_id, version_id, sha1, priority)
+        if blob is None:
+            return None
+        blob.close()
+        return blob.name
+
+    def open(
+        self,
+        client: Client,
+        file_id: str,
+        version_id: Optional[str] = None,
+        sha1: Optional[str] = None,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> BinaryIO:
+        """readable binary file with the content of a file version
+
+        Files larger than the cache are streamed, throttled at priority.
+        """
+
+        blob = self._open_version(client, file_id, version_id, sha1, priority)
+        if blob is None:
+            logging.info(" File %s is larger than the download cache, streaming it", file_id)
+            return ThrottledReader(client.downloads.download_file(file_id, version=version_id), priority)
+        return blob
+
+    def download(
+        self,
+        client: Client,
+        file_id: str,
+        local_path: str,
+        version_id: Optional[str] = None,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> None:
+        """copy a file version to local_path through the cache"""
+
+        blob = self._open_version(client, file_id, version_id, None, priority)
+        if blob is not None:
+            # cache hits are local copies, not throttled
+            with blob, open(local_path, "wb") as target:
+                shutil.copyfileobj(blob, target)
+            return
+        stream = client.downloads.download_file(file_id, version=version_id)
+        with open(local_path, "wb") as target:
+            copy_stream(stream, target, priority)
+
+    def clear(self) -> None:
+        """remove every cached blob"""
+        with self._lock:
+            for sha1 in list(self._blobs):
+                os.remove(self._blob_path(sha1))
+            self._blobs.clear()
+            self._versions.clear()
+            self._save_index()
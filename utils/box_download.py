@@ -0,0 +1,314 @@
+"""
+Download helpers for large files and folder trees
+parallel range requests written into a preallocated local file,
+and incremental mirrors of box folders
+"""
+
+import json
+import logging
+import os
+import pathlib
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Set, Tuple
+
+from box_sdk_gen import BoxSDKError
+from box_sdk_gen.client import BoxClient as Client
+from box_sdk_gen.schemas import FileFull, FileMini
+
+from utils.box_state import ItemResult, JsonManifest, write_json_atomic
+from utils.box_throttle import Priority, copy_stream
+from utils.box_utils import _list_folder_index, file_sha1
+
+logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+DEFAULT_SEGMENT_WORKERS = 4
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".json"
+SEGMENTED_DOWNLOAD_THRESHOLD = 4 * DEFAULT_SEGMENT_SIZE
+DEFAULT_MIRROR_WORKERS = 8
+MIRROR_MANIFEST = ".box_mirror.json"
+MIRROR_FIELDS = ["name", "size", "sha1", "file_version"]
+
+
+def _segments(size: int, segment_size: int) -> List[Tuple[int, int]]:
+    """inclusive (start, end) byte ranges covering size bytes"""
+    return [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+
+
+class DownloadState:
+    """sidecar record of the ranges of a .part file that are complete
+
+    Only valid for the same file version, size and segment size.
+    """
+
+    def __init__(self, path: str, file: FileFull, segment_size: int) -> None:
+        self.path = path
+        self.version_id = file.file_version.id
+        self.size = file.size
+        self.segment_size = segment_size
+        self.completed: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def load(self, part_path: str) -> bool:
+        """load the completed ranges of a previous attempt at this version"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as state_file:
+                data = json.load(state_file)
+        except (OSError, ValueError):
+            return False
+        if (data.get("version_id"), data.get("size"), data.get("segment_size")) != (
+            self.version_id,
+            self.size,
+            self.segment_size,
+        ):
+            logging.info(" Remote file changed since the last attempt, restarting download")
+            return False
+        if not os.path.exists(part_path) or os.path.getsize(part_path) != self.size:
+            return False
+        self.completed = set(data["completed"])
+        return True
+
+    def complete(self, start: int) -> None:
+        with self._lock:
+            self.completed.add(start)
+            self.save()
+
+    def save(self) -> None:
+        """atomically replace the sidecar file"""
+        data = {
+            "version_id": self.version_id,
+            "size": self.size,
+            "segment_size": self.segment_size,
+            "completed": sorted(self.completed),
+        }
+        write_json_atomic(self.path, data)
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _download_range(
+    client: Client,
+    file: FileFull,
+    local_path: str,
+    start: int,
+    end: int,
+    priority: Priority,
+    state: Optional[DownloadState] = None,
+) -> int:
+    """download one byte range into its offset of the local file"""
+
+    stream = client.downloads.download_file(file.id, version=file.file_version.id, range=f"bytes={start}-{end}")
+    with open(local_path, "r+b") as local_file:
+        local_file.seek(start)
+        copied = copy_stream(stream, local_file, priority)
+    if copied != end - start + 1:
+        raise ValueError(f"Range {start}-{end} of file {file.id} returned {copied} bytes")
+    if state is not None:
+        state.complete(start)
+    return copied
+
+
+def download_file_segmented(
+    client: Client,
+    file_id: str,
+    local_path: str,
+    max_workers: int = DEFAULT_SEGMENT_WORKERS,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+    priority: Priority = Priority.INTERACTIVE,
+) -> FileFull:
+    """download a file over several connections using byte range requests
+
+    Every range is pinned to the current file version and written at its
+    offset of a preallocated local_path.part file, with the completed ranges
+    recorded in a local_path.part.json sidecar. An interrupted download
+    resumes with the missing ranges, unless the remote version changed.
+    The result is checked against the sha1 box reports for the file.
+    """
+
+    file: FileFull = client.files.get_file_by_id(file_id, fields=["name", "size", "sha1", "file_version"])
+
+    part_path = local_path + PART_SUFFIX
+    state = DownloadState(part_path + STATE_SUFFIX, file, segment_size)
+    if state.load(part_path):
+        logging.info(" Resuming download of %s, %s ranges already done", file.name, len(state.completed))
+    else:
+        with open(part_path, "wb") as part_file:
+            part_file.truncate(file.size)
+        state.save()
+
+    segments = _segments(file.size, segment_size)
+    missing = [(start, end) for start, end in segments if start not in state.completed]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_download_range, client, file, part_path, start, end, priority, state)
+            for start, end in missing
+        ]
+        for future in futures:
+            future.result()
+
+    local_sha1 = file_sha1(part_path)
+    if local_sha1 != file.sha_1:
+        os.remove(part_path)
+        state.remove()
+        raise ValueError(f"Downloaded file {file.id} sha1 {local_sha1} does not match {file.sha_1}")
+
+    os.replace(part_path, local_path)
+    state.remove()
+    logging.info(" Downloaded %s (%s) %s bytes in %s segments", file.name, file.id, file.size, len(missing))
+    return file
+
+
+class MirrorResult(ItemResult):
+    """outcome of a single file in a folder mirror"""
+
+    def __init__(self, local_path: str, status: str, error: Optional[Exception] = None) -> None:
+        super().__init__(local_path, error)
+        self.status = status
+
+    def _describe(self) -> str:
+        return self.status
+
+
+class MirrorManifest(JsonManifest):
+    """local record of the box file version behind every mirrored file
+
+    Keys are paths relative to the local mirror folder.
+    """
+
+    def record(self, rel_path: str, local_path: str, file: FileMini) -> None:
+        stat = os.stat(local_path)
+        entry = {
+            "file_id": file.id,
+            "version_id": file.file_version.id,
+            "sha1": file.sha_1,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }
+        self.set(rel_path, entry)
+
+
+def _is_unchanged(manifest: MirrorManifest, rel_path: str, local_path: str, file: FileMini) -> bool:
+    """True when the local copy already holds the remote version"""
+
+    if not os.path.isfile(local_path):
+        return False
+    entry = manifest.get(rel_path)
+    stat = os.stat(local_path)
+    if (
+        entry is not None
+        and entry["version_id"] == file.file_version.id
+        and (entry["size"], entry["mtime"]) == (stat.st_size, stat.st_mtime)
+    ):
+        return True
+    # no usable record, compare the content instead
+    return file_sha1(local_path) == file.sha_1
+
+
+def _download_whole(client: Client, file: FileMini, local_path: str, priority: Priority) -> None:
+    """download a file in one stream, replacing the local copy atomically"""
+
+    part_path = local_path + PART_SUFFIX
+    stream = client.downloads.download_file(file.id, version=file.file_version.id)
+    with open(part_path, "wb") as part_file:
+        copy_stream(stream, part_file, priority)
+    if file_sha1(part_path) != file.sha_1:
+        os.remove(part_path)
+        raise ValueError(f"Downloaded file {file.id} does not match its sha1 {file.sha_1}")
+    os.replace(part_path, local_path)
+
+
+def folder_mirror(
+    client: Client,
+    folder_id: str,
+    local_folder_path: str,
+    max_workers: int = DEFAULT_MIRROR_WORKERS,
+    delete_removed: bool = False,
+    manifest_path: Optional[str] = None,
+) -> List[MirrorResult]:
+    """mirror a box folder tree into a local folder
+
+    Folders are listed and files downloaded concurrently by a bounded pool of
+    workers. Local files that already hold the remote version, by version id
+    or by sha1, are skipped. Files mirrored by a previous run that are gone
+    from box are deleted with delete_removed, and reported otherwise.
+    The manifest defaults to MIRROR_MANIFEST inside the local folder.
+    """
+
+    local_base = pathlib.Path(local_folder_path)
+    local_base.mkdir(parents=True, exist_ok=True)
+    manifest = MirrorManifest(manifest_path or str(local_base / MIRROR_MANIFEST))
+    results: List[MirrorResult] = []
+    seen: Set[str] = set()
+    # local folders, relative to local_base, whose box folder could not be listed
+    unlisted: List[str] = []
+
+    def list_folder(box_folder_id: str, local_folder: pathlib.Path) -> List:
+        local_folder.mkdir(parents=True, exist_ok=True)
+        return list(_list_folder_index(client, box_folder_id, fields=MIRROR_FIELDS).values())
+
+    def mirror_file(file: FileMini, local_path: pathlib.Path) -> str:
+        rel_path = local_path.relative_to(local_base).as_posix()
+        if _is_unchanged(manifest, rel_path, str(local_path), file):
+            status = "unchanged"
+        else:
+            if file.size is not None and file.size >= SEGMENTED_DOWNLOAD_THRESHOLD:
+                download_file_segmented(client, file.id, str(local_path), priority=Priority.BULK)
+            else:
+                _download_whole(client, file, str(local_path), Priority.BULK)
+            status = "downloaded"
+        manifest.record(rel_path, str(local_path), file)
+        return status
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # future -> (is_folder, local path)
+        pending: Dict[Future, Tuple[bool, pathlib.Path]] = {
+            executor.submit(list_folder, folder_id, local_base): (True, local_base)
+        }
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    is_folder, local_path = pending.pop(future)
+                    try:
+                        outcome = future.result()
+                    except (BoxSDKError, OSError, ValueError) as err:
+                        logging.error(" Failed %s: %s", local_path, err)
+                        results.append(MirrorResult(str(local_path), "failed", err))
+                        if is_folder:
+                            unlisted.append(local_path.relative_to(local_base).as_posix())
+                        continue
+                    if not is_folder:
+                        results.append(MirrorResult(str(local_path), outcome))
+                        continue
+                    for item in outcome:
+                        child_path = local_path / item.name
+                        if item.type == "folder":
+                            pending[executor.submit(list_folder, item.id, child_path)] = (True, child_path)
+                        elif item.type == "file":
+                            seen.add(child_path.relative_to(local_base).as_posix())
+                            pending[executor.submit(mirror_file, item, child_path)] = (False, child_path)
+
+            for rel_path in sorted(set(manifest.entries) - seen):
+                # the files below a folder that failed to list are unknown, "." is the root
+                if any(folder == "." or rel_path.startswith(folder + "/") for folder in unlisted):
+                    continue
+                local_path = local_base / rel_path
+                if delete_removed:
+                    if local_path.exists():
+                        local_path.unlink()
+                    manifest.forget(rel_path)
+                    results.append(MirrorResult(str(local_path), "deleted"))
+                else:
+                    logging.warning(" %s was removed from box", rel_path)
+                    results.append(MirrorResult(str(local_path), "removed_remotely"))
+        finally:
+            manifest.save()
+
+    return results
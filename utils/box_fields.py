@@ -0,0 +1,22 @@
+"""
+Named field projections for listing, search and get calls
+box only returns the requested fields, plus type, id and etag
+"""
+
+from typing import Dict, List, Optional
+
+# None means the server defaults
+FIELD_PROFILES: Dict[str, Optional[List[str]]] = {
+    "id-only": ["id"],
+    "listing": ["name", "size", "modified_at"],
+    "sync": ["name", "size", "sha1", "file_version", "modified_at", "etag"],
+    "full": None,
+}
+
+
+def profile_fields(profile: str) -> Optional[List[str]]:
+    """the fields parameter for a named profile"""
+    try:
+        return FIELD_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown field profile {profile!r}, use one of {', '.join(FIELD_PROFILES)}") from None
@@ -0,0 +1,296 @@
+"""
+Local SQLite index of a box folder tree
+built with one full crawl, then kept current from the events stream
+"""
+
+import datetime
+import logging
+import sqlite3
+import threading
+from typing import Iterator, List, Optional
+
+from box_sdk_gen.client import BoxClient as Client
+
+from utils.box_listing import skip_missing_folders, walk_folder_tree
+
+logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = "box_index.db"
+INDEX_FIELDS = ["name", "size", "sha1", "modified_at", "etag"]
+EVENTS_PAGE_SIZE = 500
+REMOVE_EVENTS = {"ITEM_TRASH", "ITEM_DELETE"}
+UPSERT_EVENTS = {
+    "ITEM_CREATE",
+    "ITEM_UPLOAD",
+    "ITEM_COPY",
+    "ITEM_MOVE",
+    "ITEM_RENAME",
+    "ITEM_MODIFY",
+    "ITEM_UNDELETE_VIA_TRASH",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER,
+    sha1 TEXT,
+    modified_at TEXT,
+    etag TEXT
+);
+CREATE INDEX IF NOT EXISTS items_parent_name ON items (parent_id, name);
+CREATE INDEX IF NOT EXISTS items_sha1 ON items (sha1);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+COLUMNS = ("id", "parent_id", "name", "type", "size", "sha1", "modified_at", "etag")
+
+
+class IndexedItem:
+    """one row of the index"""
+
+    __slots__ = COLUMNS
+
+    def __init__(self, *values) -> None:
+        for column, value in zip(COLUMNS, values):
+            setattr(self, column, value)
+
+    def __repr__(self) -> str:
+        return f"IndexedItem({self.type} {self.id} {self.name!r})"
+
+
+def _timestamp(value) -> Optional[str]:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+class BoxIndex:
+    """folders and files of one box tree, queried locally
+
+    build crawls the tree once, refresh applies the events recorded since
+    the saved stream position. Lookups and walks never call the API.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> "BoxIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    # region state
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str) -> None:
+        self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def root_id(self) -> Optional[str]:
+        with self._lock:
+            return self._get_state("root_id")
+
+    @property
+    def stream_position(self) -> Optional[str]:
+        with self._lock:
+            return self._get_state("stream_position")
+
+    # endregion
+
+    def _upsert(self, parent_id: Optional[str], item: dict) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                item["id"],
+                parent_id,
+                item.get("name"),
+                item["type"],
+                item.get("size"),
+                item.get("sha1"),
+                _timestamp(item.get("modified_at")),
+                item.get("etag"),
+            ),
+        )
+
+    def _remove_tree(self, item_id: str) -> None:
+        self._db.execute(
+            """
+            WITH RECURSIVE tree(id) AS (
+                SELECT ? UNION ALL SELECT items.id FROM items JOIN tree ON items.parent_id = tree.id
+            )
+            DELETE FROM items WHERE id IN (SELECT id FROM tree)
+            """,
+            (item_id,),
+        )
+
+    def _crawl(self, client: Client, folder_id: str, max_workers: int) -> int:
+        """index every item below folder_id, returns the number of items"""
+        count = 0
+        # a folder deleted during the crawl is dropped again by the next refresh
+        for listing in walk_folder_tree(
+            client, folder_id, max_workers=max_workers, fields=INDEX_FIELDS, on_error=skip_missing_folders
+        ):
+            with self._lock:
+                for item in listing.items:
+                    self._upsert(listing.folder_id, item.to_dict())
+                self._db.commit()
+            count += len(listing.items)
+        return count
+
+    def build(self, client: Client, folder_id: str = "0", max_workers: int = 8) -> int:
+        """replace the index with a full crawl of folder_id"""
+
+        # events recorded during the crawl are replayed by the next refresh
+        position = client.events.get_events(stream_position="now").next_stream_position
+        folder = client.folders.get_folder_by_id(folder_id, fields=INDEX_FIELDS)
+        with self._lock:
+            self._db.execute("DELETE FROM items")
+            # without a stream position the index counts as not built until the crawl completes
+            self._db.execute("DELETE FROM state WHERE key = 'stream_position'")
+            self._upsert(None, folder.to_dict())
+            self._set_state("root_id", folder_id)
+            self._db.commit()
+
+        count = self._crawl(client, folder_id, max_workers)
+        with self._lock:
+            self._set_state("stream_position", str(position))
+            self._db.commit()
+        logging.info(" Indexed %s items below folder %s", count, folder_id)
+        return count
+
+    def refresh(self, client: Client, max_workers: int = 8) -> int:
+        """apply the events since the saved stream position, returns how many"""
+
+        position = self.stream_position
+        if position is None:
+            raise ValueError("The index has not been built yet, or its last build did not complete")
+
+        applied = 0
+        while True:
+            events = client.events.get_events(stream_position=position, limit=EVENTS_PAGE_SIZE)
+            for event in events.entries or []:
+                if event.source is not None and event.event_type is not None:
+                    applied += self._apply_event(client, event.event_type.value, event.source.to_dict(), max_workers)
+            position = str(events.next_stream_position)
+            with self._lock:
+                self._set_state("stream_position", position)
+                self._db.commit()
+            if not events.entries:
+                break
+
+        logging.info(" Applied %s events to the index", applied)
+        return applied
+
+    def _apply_event(self, client: Client, event_type: str, source: dict, max_workers: int) -> int:
+        if source.get("type") not in ("file", "folder", "web_link") or source.get("id") == self.root_id:
+            return 0
+        parent_id = (source.get("parent") or {}).get("id")
+
+        with self._lock:
+            known = self._db.execute("SELECT 1 FROM items WHERE id = ?", (source["id"],)).fetchone() is not None
+            parent_known = (
+                parent_id is not None
+                and self._db.execute("SELECT 1 FROM items WHERE id = ? AND type = 'folder'", (parent_id,)).fetchone()
+                is not None
+            )
+            if event_type in REMOVE_EVENTS or (event_type in UPSERT_EVENTS and not parent_known):
+                # trashed, or moved out of the indexed tree
+                if not known:
+                    return 0
+                self._remove_tree(source["id"])
+                self._db.commit()
+                return 1
+            if event_type not in UPSERT_EVENTS:
+                return 0
+            self._upsert(parent_id, source)
+            self._db.commit()
+
+        if source["type"] == "folder" and not known:
+            # a folder copied, moved or restored into the tree brings its content along
+            self._crawl(client, source["id"], max_workers)
+        return 1
+
+    # region queries
+
+    def get(self, item_id: str) -> Optional[IndexedItem]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM items WHERE id = ?", (item_id,)).fetchone()
+        return IndexedItem(*row) if row else None
+
+    def find(self, parent_id: str, name: str) -> Optional[IndexedItem]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM items WHERE parent_id = ? AND name = ?", (parent_id, name)).fetchone()
+        return IndexedItem(*row) if row else None
+
+    def children(self, folder_id: str) -> List[IndexedItem]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM items WHERE parent_id = ? ORDER BY type DESC, name", (folder_id,)
+            ).fetchall()
+        return [IndexedItem(*row) for row in rows]
+
+    def by_sha1(self, sha1: str) -> List[IndexedItem]:
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM items WHERE sha1 = ?", (sha1,)).fetchall()
+        return [IndexedItem(*row) for row in rows]
+
+    def resolve(self, path: str) -> Optional[IndexedItem]:
+        """the item at a / separated path below the indexed root"""
+        item = self.get(self.root_id)
+        for name in [segment for segment in path.split("/") if segment]:
+            if item is None:
+                return None
+            item = self.find(item.id, name)
+        return item
+
+    def path_of(self, item_id: str) -> Optional[str]:
+        """the / separated path of an item below the indexed root"""
+        names = []
+        item = self.get(item_id)
+        while item is not None and item.id != self.root_id:
+            names.append(item.name)
+            item = self.get(item.parent_id)
+        if item is None:
+            return None
+        return "/" + "/".join(reversed(names))
+
+    def walk(self, folder_id: Optional[str] = None) -> Iterator[IndexedItem]:
+        """every item below a folder, parents before their children"""
+        folder_id = folder_id or self.root_id
+        with self._lock:
+            rows = self._db.execute(
+                """
+                WITH RECURSIVE tree(id, depth) AS (
+                    SELECT ?, 0
+                    UNION ALL
+                    SELECT items.id, tree.depth + 1 FROM items JOIN tree ON items.parent_id = tree.id
+                )
+                SELECT items.* FROM items JOIN tree ON items.id = tree.id WHERE tree.depth > 0
+                ORDER BY tree.depth
+                """,
+                (folder_id,),
+            ).fetchall()
+        for row in rows:
+            yield IndexedItem(*row)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    # endregion
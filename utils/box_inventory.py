@@ -0,0 +1,166 @@
+"""
+Inventory export of a box folder tree
+rows are streamed to JSONL or CSV as folders are listed, with a
+checkpoint to resume an interrupted export
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from box_sdk_gen.client import BoxClient as Client
+
+from utils.box_listing import FolderListing, skip_missing_folders, walk_folder_tree
+from utils.box_state import write_json_atomic
+
+logging.getLogger(__name__)
+
+INVENTORY_COLUMNS = ["path", "id", "type", "size", "owner", "sha1", "created_at", "modified_at"]
+INVENTORY_FIELDS = ["name", "size", "sha1", "created_at", "modified_at", "owned_by"]
+INVENTORY_FORMATS = ("jsonl", "csv")
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+CHECKPOINT_INTERVAL = 2.0
+
+
+def _inventory_row(listing: FolderListing, item) -> dict:
+    # listing entries are mini objects, the extra fields are only in the json
+    data = item.to_dict()
+    return {
+        "path": "/" + "/".join(listing.path + (data["name"],)),
+        "id": data["id"],
+        "type": data["type"],
+        "size": data.get("size"),
+        "owner": (data.get("owned_by") or {}).get("login"),
+        "sha1": data.get("sha1"),
+        "created_at": data.get("created_at"),
+        "modified_at": data.get("modified_at"),
+    }
+
+
+class InventoryCheckpoint:
+    """how far an export got: bytes written and the folders still to list"""
+
+    def __init__(self, path: str, folder_id: str, output_format: str) -> None:
+        self.path = path
+        self.folder_id = folder_id
+        self.output_format = output_format
+        self.offset = 0
+        self.rows = 0
+        # folder id -> (path, depth), in breadth first order
+        self.frontier: Dict[str, Tuple[Tuple[str, ...], int]] = {}
+
+    def load(self) -> bool:
+        """True when a checkpoint of this export exists"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as checkpoint_file:
+                data = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return False
+        if (data["folder_id"], data["format"]) != (self.folder_id, self.output_format):
+            raise ValueError(f"Checkpoint {self.path} belongs to another export")
+        self.offset = data["offset"]
+        self.rows = data["rows"]
+        self.frontier = {folder_id: (tuple(path), depth) for folder_id, path, depth in data["frontier"]}
+        return True
+
+    def save(self) -> None:
+        """atomically replace the checkpoint file"""
+        data = {
+            "folder_id": self.folder_id,
+            "format": self.output_format,
+            "offset": self.offset,
+            "rows": self.rows,
+            "frontier": [[folder_id, list(path), depth] for folder_id, (path, depth) in self.frontier.items()],
+        }
+        write_json_atomic(self.path, data)
+
+    def remove(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def export_inventory(
+    client: Client,
+    folder_id: str,
+    output_path: str,
+    output_format: Optional[str] = None,
+    max_workers: int = 8,
+    resume: bool = True,
+) -> int:
+    """write one row per item below folder_id to a JSONL or CSV file
+
+    Rows hold the path relative to folder_id, id, type, size, owner login,
+    sha1 and timestamps, and are written as each folder is listed, so only
+    the folders still to list are kept in memory. The format defaults to
+    the output extension. Progress is checkpointed next to the output, an
+    interrupted export resumes from there unless resume is False.
+    Returns the number of rows written.
+    """
+
+    output_format = output_format or os.path.splitext(output_path)[1].lstrip(".").lower()
+    if output_format not in INVENTORY_FORMATS:
+        raise ValueError(f"Unknown inventory format {output_format!r}, use one of {', '.join(INVENTORY_FORMATS)}")
+
+    checkpoint = InventoryCheckpoint(output_path + CHECKPOINT_SUFFIX, folder_id, output_format)
+    resumed = resume and checkpoint.load() and os.path.exists(output_path)
+    if resumed:
+        # drop rows written after the last checkpoint, their folders are listed again
+        os.truncate(output_path, checkpoint.offset)
+        logging.info(" Resuming inventory after %s rows, %s folders to go", checkpoint.rows, len(checkpoint.frontier))
+    else:
+        checkpoint = InventoryCheckpoint(checkpoint.path, folder_id, output_format)
+        checkpoint.frontier[folder_id] = ((), 0)
+
+    frontier: List[Tuple[str, Tuple[str, ...], int]] = [
+        (box_folder_id, path, depth) for box_folder_id, (path, depth) in checkpoint.frontier.items()
+    ]
+    last_save = time.monotonic()
+
+    def skip_folder(listing: FolderListing, err: Exception) -> None:
+        # a folder deleted during the export has no rows, and nothing left to list
+        skip_missing_folders(listing, err)
+        del checkpoint.frontier[listing.folder_id]
+
+    with open(output_path, "ab" if resumed else "wb") as output:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=INVENTORY_COLUMNS) if output_format == "csv" else None
+        if writer is not None and not resumed:
+            writer.writeheader()
+
+        for listing in walk_folder_tree(
+            client,
+            folder_id,
+            max_workers=max_workers,
+            fields=INVENTORY_FIELDS,
+            frontier=frontier,
+            on_error=skip_folder,
+        ):
+            for item in listing.items:
+                row = _inventory_row(listing, item)
+                if writer is not None:
+                    writer.writerow(row)
+                else:
+                    buffer.write(json.dumps(row) + "\n")
+                if item.type == "folder":
+                    checkpoint.frontier[item.id] = (listing.path + (item.name,), listing.depth + 1)
+            output.write(buffer.getvalue().encode("utf-8"))
+            buffer.seek(0)
+            buffer.truncate()
+            checkpoint.rows += len(listing.items)
+            del checkpoint.frontier[listing.folder_id]
+
+            if time.monotonic() - last_save >= CHECKPOINT_INTERVAL:
+                output.flush()
+                os.fsync(output.fileno())
+                checkpoint.offset = output.tell()
+                checkpoint.save()
+                last_save = time.monotonic()
+                logging.info(" Inventory %s rows, %s folders to go", checkpoint.rows, len(checkpoint.frontier))
+
+    checkpoint.remove()
+    logging.info(" Inventory of folder %s written to %s, %s rows", folder_id, output_path, checkpoint.rows)
+    return checkpoint.rows
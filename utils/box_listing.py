@@ -0,0 +1,268 @@
+"""
+Lazy folder listings and tree walks
+follows marker pagination so large folders stream with constant memory,
+and walks folder trees breadth first with a bounded pool of workers
+"""
+
+import logging
+import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Iterator, List, Optional, Tuple, Union
+
+from box_sdk_gen import BoxAPIError, BoxSDKError
+from box_sdk_gen.client import BoxClient as Client
+from box_sdk_gen.managers.folders import Items
+from box_sdk_gen.networking.fetch import FetchOptions, fetch
+from box_sdk_gen.schemas import FileMini, FolderMini, WebLinkMini
+
+logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 1000
+DEFAULT_WALK_WORKERS = 8
+WALK_FIELDS = ["name"]
+RECORD_FIELDS = ["name", "size", "sha1", "modified_at"]
+
+
+def _get_page(
+    client: Client, folder_id: str, fields: Optional[List[str]], page_size: int, marker: Optional[str]
+) -> Items:
+    return client.folders.get_folder_items(folder_id, fields=fields, usemarker=True, marker=marker, limit=page_size)
+
+
+def iter_folder_pages(
+    client: Client,
+    folder_id: str,
+    fields: Optional[List[str]] = None,
+    page_size: int = MAX_PAGE_SIZE,
+    prefetch: bool = False,
+) -> Iterator[Items]:
+    """every page of a folder listing, following the next marker
+
+    With prefetch the next page is requested while the caller works on the
+    current one, so at most two pages are held at a time.
+    """
+
+    if not 0 < page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}, got {page_size}")
+
+    if not prefetch:
+        marker = None
+        while True:
+            page = _get_page(client, folder_id, fields, page_size, marker)
+            yield page
+            marker = page.next_marker
+            if not marker:
+                return
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(_get_page, client, folder_id, fields, page_size, None)
+        while future is not None:
+            page = future.result()
+            future = None
+            if page.next_marker:
+                future = executor.submit(_get_page, client, folder_id, fields, page_size, page.next_marker)
+            yield page
+
+
+def iter_folder_items(
+    client: Client,
+    folder_id: str,
+    fields: Optional[List[str]] = None,
+    page_size: int = MAX_PAGE_SIZE,
+    prefetch: bool = False,
+) -> Iterator[Union[FileMini, FolderMini, WebLinkMini]]:
+    """every item of a box folder, fetched a page at a time as it is consumed"""
+
+    for page in iter_folder_pages(client, folder_id, fields, page_size, prefetch):
+        yield from page.entries
+
+
+class ItemRecord:
+    """compact, slotted stand in for FileMini and FolderMini
+
+    Built straight from the listing json, without the SDK objects and their
+    per instance dicts. modified_at stays the ISO 8601 string box sent.
+    """
+
+    __slots__ = ("id", "type", "name", "parent_id", "size", "sha1", "modified_at")
+
+    def __init__(
+        self,
+        id: str,
+        type: str,
+        name: str,
+        parent_id: Optional[str] = None,
+        size: Optional[int] = None,
+        sha1: Optional[str] = None,
+        modified_at: Optional[str] = None,
+    ) -> None:
+        self.id = id
+        self.type = type
+        self.name = name
+        self.parent_id = parent_id
+        self.size = size
+        self.sha1 = sha1
+        self.modified_at = modified_at
+
+    @classmethod
+    def from_json(cls, data: dict, parent_id: Optional[str] = None) -> "ItemRecord":
+        return cls(
+            data["id"],
+            sys.intern(data["type"]),
+            data.get("name"),
+            parent_id or (data.get("parent") or {}).get("id"),
+            data.get("size"),
+            data.get("sha1"),
+            data.get("modified_at"),
+        )
+
+    def __repr__(self) -> str:
+        return f"ItemRecord({self.type} {self.id} {self.name!r})"
+
+
+def iter_folder_records(
+    client: Client,
+    folder_id: str,
+    fields: Optional[List[str]] = None,
+    page_size: int = MAX_PAGE_SIZE,
+) -> Iterator[ItemRecord]:
+    """every item of a box folder as an ItemRecord, a page at a time
+
+    Requests the pages directly and skips the SDK deserialization.
+    """
+
+    if not 0 < page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}, got {page_size}")
+
+    manager = client.folders
+    params = {"fields": ",".join(fields or RECORD_FIELDS), "usemarker": "true", "limit": str(page_size)}
+    while True:
+        response = fetch(
+            FetchOptions(
+                url=f"{manager.network_session.base_urls.base_url}/2.0/folders/{folder_id}/items",
+                method="GET",
+                params=params,
+                headers={},
+                response_format="json",
+                auth=manager.auth,
+                network_session=manager.network_session,
+            )
+        )
+        for entry in response.data["entries"]:
+            yield ItemRecord.from_json(entry, folder_id)
+        marker = response.data.get("next_marker")
+        if not marker:
+            return
+        params["marker"] = marker
+
+
+class FolderListing:
+    """the items of one folder reached by walk_folder_tree"""
+
+    def __init__(
+        self,
+        folder_id: str,
+        name: Optional[str],
+        path: Tuple[str, ...],
+        depth: int,
+        items: List[Union[FileMini, FolderMini, WebLinkMini, ItemRecord]],
+    ) -> None:
+        self.folder_id = folder_id
+        self.name = name
+        # names from the walk root down to this folder, empty for the root
+        self.path = path
+        self.depth = depth
+        self.items = items
+
+    @property
+    def folders(self) -> List[Union[FolderMini, ItemRecord]]:
+        return [item for item in self.items if item.type == "folder"]
+
+    def __repr__(self) -> str:
+        return f"FolderListing({self.folder_id!r}, {'/'.join(self.path)!r}, {len(self.items)} items)"
+
+
+def walk_folder_tree(
+    client: Client,
+    folder_id: str,
+    max_workers: int = DEFAULT_WALK_WORKERS,
+    max_depth: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+    on_folder: Optional[Callable[[FolderListing], None]] = None,
+    compact: bool = False,
+    frontier: Optional[List[Tuple[str, Tuple[str, ...], int]]] = None,
+    on_error: Optional[Callable[[FolderListing, Exception], None]] = None,
+) -> Iterator[FolderListing]:
+    """breadth first walk of a folder tree, listing folders concurrently
+
+    Yields one FolderListing per folder in breadth first order, and calls
+    on_folder with it first. Up to max_workers folders are listed at once,
+    max_depth limits how many levels are listed, None for the whole tree.
+    Folder names come from the parent listing, so there is no request per
+    folder besides its listing pages. With compact the items are
+    ItemRecords, for walks too large for the SDK objects. frontier
+    continues an earlier walk from its (folder id, path, depth) entries
+    not yet listed, instead of starting at folder_id.
+
+    A folder that fails to list ends the walk with its error, unless
+    on_error is given. It is then called with the empty listing of that
+    folder and the error, and the walk goes on without the folder, or
+    stops if on_error raises. See skip_missing_folders.
+    """
+
+    def list_folder(box_folder_id: str) -> List[Union[FileMini, FolderMini, WebLinkMini, ItemRecord]]:
+        if compact:
+            return list(iter_folder_records(client, box_folder_id, fields=fields))
+        return list(iter_folder_items(client, box_folder_id, fields=fields or WALK_FIELDS))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # futures in submission order, which is breadth first order
+        queue: Deque[Tuple[Future, str, Optional[str], Tuple[str, ...], int]] = deque()
+        for box_folder_id, path, depth in frontier or [(folder_id, (), 0)]:
+            name = path[-1] if path else None
+            queue.append((executor.submit(list_folder, box_folder_id), box_folder_id, name, tuple(path), depth))
+        try:
+            while queue:
+                future, box_folder_id, name, path, depth = queue.popleft()
+                try:
+                    items = future.result()
+                except (BoxSDKError, OSError, ValueError) as err:
+                    if on_error is None:
+                        raise
+                    on_error(FolderListing(box_folder_id, name, path, depth, []), err)
+                    continue
+                listing = FolderListing(box_folder_id, name, path, depth, items)
+                if max_depth is None or depth + 1 < max_depth:
+                    for folder in listing.folders:
+                        queue.append(
+                            (
+                                executor.submit(list_folder, folder.id),
+                                folder.id,
+                                folder.name,
+                                path + (folder.name,),
+                                depth + 1,
+                            )
+                        )
+                if on_folder is not None:
+                    on_folder(listing)
+                yield listing
+        finally:
+            # a caller that stops early should not wait for the rest of the tree
+            for future, *_ in queue:
+                future.cancel()
+
+
+def skip_missing_folders(listing: FolderListing, err: Exception) -> None:
+    """on_error for walk_folder_tree skipping folders deleted during the walk
+
+    Any other error, and a missing walk root, still ends the walk.
+    """
+    if (
+        listing.depth > 0
+        and isinstance(err, BoxAPIError)
+        and err.response_info.body.get("code", None) in ("not_found", "trashed")
+    ):
+        logging.warning(" Folder %s is gone, skipping it", "/".join(listing.path))
+        return
+    raise err
@@ -0,0 +1,86 @@
+"""
+Resolve box paths like /workshops/folders to item ids
+folder listings are cached by name for a limited time
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+
+from box_sdk_gen.client import BoxClient as Client
+from box_sdk_gen.schemas import FileMini, FolderMini, WebLinkMini
+
+from utils.box_listing import iter_folder_items
+
+logging.getLogger(__name__)
+
+ROOT_FOLDER_ID = "0"
+# the root folder always exists, no need to fetch it
+ROOT_FOLDER = FolderMini(id=ROOT_FOLDER_ID, name="All Files")
+DEFAULT_PATH_TTL = 300.0
+PATH_FIELDS = ["name"]
+
+
+class PathResolver:
+    """path -> box item, one listing per folder not seen in the last ttl seconds
+
+    Every listing is indexed by name, so the siblings of a segment are
+    resolved from the same listing, and a name missing from a fresh listing
+    is reported without another request.
+    """
+
+    def __init__(self, client: Client, ttl: float = DEFAULT_PATH_TTL) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.listings = 0
+        # folder id -> (expires at, name -> item)
+        self._folders: Dict[str, Tuple[float, Dict[str, Union[FileMini, FolderMini, WebLinkMini]]]] = {}
+        self._lock = threading.Lock()
+
+    def _children(self, folder_id: str) -> Dict[str, Union[FileMini, FolderMini, WebLinkMini]]:
+        with self._lock:
+            cached = self._folders.get(folder_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        children = {item.name: item for item in iter_folder_items(self.client, folder_id, fields=PATH_FIELDS)}
+        self.listings += 1
+        with self._lock:
+            self._folders[folder_id] = (time.monotonic() + self.ttl, children)
+        return children
+
+    def get(self, path: str, base_folder_id: str = ROOT_FOLDER_ID) -> Union[FileMini, FolderMini, WebLinkMini]:
+        """the item at a / separated path, relative to base_folder_id"""
+
+        item: Union[FileMini, FolderMini, WebLinkMini] = (
+            ROOT_FOLDER if base_folder_id == ROOT_FOLDER_ID else FolderMini(id=base_folder_id)
+        )
+        walked = []
+        for name in [segment for segment in path.split("/") if segment]:
+            if item.type != "folder":
+                raise ValueError(f"'/{'/'.join(walked)}' is not a folder")
+            item = self._children(item.id).get(name)
+            walked.append(name)
+            if item is None:
+                raise ValueError(f"'/{'/'.join(walked)}' not found")
+        return item
+
+    def resolve(self, path: str, base_folder_id: str = ROOT_FOLDER_ID) -> str:
+        """the id of the item at a / separated path"""
+        return self.get(path, base_folder_id).id
+
+    def add(self, parent_id: str, item: Union[FileMini, FolderMini, WebLinkMini]) -> None:
+        """record an item created in a cached folder"""
+        with self._lock:
+            cached = self._folders.get(parent_id)
+            if cached is not None:
+                cached[1][item.name] = item
+
+    def invalidate(self, folder_id: Optional[str] = None) -> None:
+        """forget the listing of one folder, or of every folder"""
+        with self._lock:
+            if folder_id is None:
+                self._folders.clear()
+            else:
+                self._folders.pop(folder_id, None)
@@ -0,0 +1,74 @@
+"""
+Local state files and per item results shared by the bulk helpers
+json files are replaced atomically, so a crash leaves either the old
+or the new content, never a partial file
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+TMP_SUFFIX = ".tmp"
+
+
+def write_json_atomic(path: str, data, **dump_args) -> None:
+    """write data as json to a temporary file, then move it over path"""
+    tmp_path = path + TMP_SUFFIX
+    with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+        json.dump(data, tmp_file, **dump_args)
+    os.replace(tmp_path, path)
+
+
+class JsonManifest:
+    """thread safe record of local files, keyed by path relative to a base folder
+
+    Entries are plain json dicts, loaded from path when it exists.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as manifest_file:
+                self.entries = json.load(manifest_file)
+        except FileNotFoundError:
+            pass
+
+    def get(self, rel_path: str) -> Optional[dict]:
+        with self._lock:
+            return self.entries.get(rel_path)
+
+    def set(self, rel_path: str, entry: dict) -> None:
+        with self._lock:
+            self.entries[rel_path] = entry
+
+    def forget(self, rel_path: str) -> None:
+        with self._lock:
+            self.entries.pop(rel_path, None)
+
+    def save(self) -> None:
+        """atomically replace the manifest file"""
+        with self._lock:
+            write_json_atomic(self.path, self.entries, indent=1, sort_keys=True)
+
+
+class ItemResult:
+    """outcome of a single local item in a bulk transfer"""
+
+    def __init__(self, local_path: str, error: Optional[Exception] = None) -> None:
+        self.local_path = local_path
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def _describe(self) -> str:
+        """what happened to the item, when it succeeded"""
+        return "ok"
+
+    def __repr__(self) -> str:
+        outcome = self._describe() if self.ok else f"error={self.error!r}"
+        return f"{type(self).__name__}({self.local_path!r}, {outcome})"
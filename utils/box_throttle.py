@@ -0,0 +1,127 @@
+"""
+Process wide bandwidth limiting for uploads and downloads
+bulk transfers only get the capacity interactive transfers leave
+"""
+
+import os
+import threading
+import time
+from enum import Enum
+from typing import BinaryIO, Optional
+
+ENV_MAX_BYTES_PER_SECOND = "BOX_MAX_BYTES_PER_SECOND"
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class Priority(str, Enum):
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+
+
+class BandwidthLimiter:
+    """token bucket shared by every transfer in the process
+
+    Interactive transfers are served first, bulk transfers wait while any
+    interactive transfer is waiting for tokens. A rate of None is unlimited.
+    """
+
+    def __init__(self, bytes_per_second: Optional[float] = None) -> None:
+        self._condition = threading.Condition()
+        self._interactive_waiting = 0
+        self.set_rate(bytes_per_second)
+
+    def set_rate(self, bytes_per_second: Optional[float]) -> None:
+        """change the ceiling, the bucket holds at most one second of tokens"""
+        with self._condition:
+            self.rate = bytes_per_second
+            self._tokens = bytes_per_second or 0.0
+            self._updated = time.monotonic()
+            self._condition.notify_all()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, size: int, priority: Priority = Priority.BULK) -> None:
+        """block until size bytes may be transferred"""
+        if not self.rate or size <= 0:
+            return
+
+        with self._condition:
+            interactive = priority == Priority.INTERACTIVE
+            if interactive:
+                self._interactive_waiting += 1
+            try:
+                while self.rate:
+                    self._refill()
+                    # larger requests than the bucket go into debt instead of waiting forever
+                    needed = min(size, self.rate)
+                    if (interactive or not self._interactive_waiting) and self._tokens >= needed:
+                        self._tokens -= size
+                        return
+                    self._condition.wait(timeout=max(needed - self._tokens, 1) / self.rate)
+            finally:
+                if interactive:
+                    self._interactive_waiting -= 1
+                    self._condition.notify_all()
+
+
+BANDWIDTH_LIMITER = BandwidthLimiter(float(os.getenv(ENV_MAX_BYTES_PER_SECOND, "0")) or None)
+
+
+def set_bandwidth_limit(bytes_per_second: Optional[float]) -> None:
+    """set the bytes per second ceiling for all transfers, None for unlimited"""
+    BANDWIDTH_LIMITER.set_rate(bytes_per_second)
+
+
+def copy_stream(
+    source: BinaryIO,
+    target: BinaryIO,
+    priority: Priority = Priority.INTERACTIVE,
+    limiter: Optional[BandwidthLimiter] = None,
+) -> int:
+    """throttled replacement for shutil.copyfileobj, returns the bytes copied"""
+
+    limiter = limiter or BANDWIDTH_LIMITER
+    copied = 0
+    while True:
+        buffer = source.read(COPY_BUFFER_SIZE)
+        if not buffer:
+            return copied
+        limiter.consume(len(buffer), priority)
+        target.write(buffer)
+        copied += len(buffer)
+
+
+class ThrottledReader:
+    """read only wrapper that throttles the reads of a stream"""
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        priority: Priority = Priority.INTERACTIVE,
+        limiter: Optional[BandwidthLimiter] = None,
+    ) -> None:
+        self.stream = stream
+        self.priority = priority
+        self.limiter = limiter or BANDWIDTH_LIMITER
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > COPY_BUFFER_SIZE:
+            size = COPY_BUFFER_SIZE
+        buffer = self.stream.read(size)
+        self.limiter.consume(len(buffer), self.priority)
+        return buffer
+
+    def readable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.stream.close()
+
+    def __enter__(self) -> "ThrottledReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
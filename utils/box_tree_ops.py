@@ -0,0 +1,394 @@
+"""
+Bulk copy, move and delete of box folder trees
+operations are planned per item and run concurrently, parents before
+children for creations and children before parents for deletions,
+with a checkpoint file to resume after failures
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from box_sdk_gen import BoxAPIError, BoxSDKError
+from box_sdk_gen.client import BoxClient as Client
+from box_sdk_gen.managers.files import CopyFileParent, UpdateFileByIdParent
+from box_sdk_gen.managers.folders import CreateFolderParent, UpdateFolderByIdParent
+from box_sdk_gen.managers.web_links import UpdateWebLinkByIdParent
+
+from utils.box_listing import FolderListing, skip_missing_folders, walk_folder_tree
+from utils.box_state import write_json_atomic
+
+logging.getLogger(__name__)
+
+DEFAULT_TREE_WORKERS = 8
+CHECKPOINT_INTERVAL = 1.0
+PROGRESS_INTERVAL = 2.0
+
+
+class TreeTask:
+    """one request of a plan, run once every task in after is done
+
+    action gets the results of the finished tasks and returns its own
+    result, e.g. the id of a created folder.
+    """
+
+    def __init__(self, key: str, action: Callable[[Dict[str, Optional[str]]], Optional[str]], after: List[str]):
+        self.key = key
+        self.action = action
+        self.after = after
+
+
+class TreeCheckpoint:
+    """results of the finished tasks of a plan, saved to a json file"""
+
+    def __init__(self, path: Optional[str], plan_id: str) -> None:
+        self.path = path
+        self.plan_id = plan_id
+        self.done: Dict[str, Optional[str]] = {}
+        self._saved = 0.0
+        if path is None:
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as checkpoint_file:
+                data = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return
+        if data.get("plan") == plan_id:
+            self.done = data["done"]
+        else:
+            logging.warning(" Checkpoint %s belongs to another operation, starting over", path)
+
+    def save(self, force: bool = False) -> None:
+        """atomically replace the checkpoint file, at most once per interval"""
+        if self.path is None or (not force and time.monotonic() - self._saved < CHECKPOINT_INTERVAL):
+            return
+        write_json_atomic(self.path, {"plan": self.plan_id, "done": self.done})
+        self._saved = time.monotonic()
+
+    def remove(self) -> None:
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class TreeOpResult:
+    """outcome of running a plan"""
+
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.done = 0
+        self.resumed = 0
+        self.failed: Dict[str, Exception] = {}
+        self.blocked = 0
+        self.results: Dict[str, Optional[str]] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed and not self.blocked
+
+    def __repr__(self) -> str:
+        return (
+            f"TreeOpResult(total={self.total}, done={self.done}, resumed={self.resumed}, "
+            f"failed={len(self.failed)}, blocked={self.blocked})"
+        )
+
+
+def run_plan(
+    tasks: List[TreeTask],
+    checkpoint: TreeCheckpoint,
+    max_workers: int = DEFAULT_TREE_WORKERS,
+) -> TreeOpResult:
+    """run tasks concurrently, respecting their ordering constraints
+
+    Tasks already in the checkpoint are skipped. A failed task blocks the
+    tasks that depend on it, every other branch still runs.
+    The checkpoint is removed once every task succeeded.
+    """
+
+    result = TreeOpResult(len(tasks))
+    results = result.results
+    results.update(checkpoint.done)
+    waiting_on: Dict[str, int] = {}
+    dependents: Dict[str, List[TreeTask]] = {}
+    ready: List[TreeTask] = []
+    for task in tasks:
+        if task.key in results:
+            result.resumed += 1
+            continue
+        missing = [key for key in task.after if key not in results]
+        waiting_on[task.key] = len(missing)
+        for key in missing:
+            dependents.setdefault(key, []).append(task)
+        if not missing:
+            ready.append(task)
+
+    lock = threading.Lock()
+    last_report = time.monotonic()
+
+    def run(task: TreeTask) -> Optional[str]:
+        with lock:
+            snapshot = dict(results)
+        return task.action(snapshot)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending: Dict[Future, TreeTask] = {executor.submit(run, task): task for task in ready}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = pending.pop(future)
+                    try:
+                        value = future.result()
+                    except (BoxSDKError, ValueError) as err:
+                        logging.error(" Failed %s: %s", task.key, err)
+                        result.failed[task.key] = err
+                        continue
+                    with lock:
+                        results[task.key] = value
+                    checkpoint.done[task.key] = value
+                    result.done += 1
+                    for dependent in dependents.pop(task.key, []):
+                        waiting_on[dependent.key] -= 1
+                        if waiting_on[dependent.key] == 0:
+                            pending[executor.submit(run, dependent)] = dependent
+                checkpoint.save()
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    logging.info(" %s of %s operations done", result.done + result.resumed, result.total)
+        finally:
+            checkpoint.save(force=True)
+
+    result.blocked = result.total - result.done - result.resumed - len(result.failed)
+    if result.ok:
+        checkpoint.remove()
+    logging.info(" %s", result)
+    return result
+
+
+def _create_folder(client: Client, name: str, parent_id: str, merge: bool = True) -> str:
+    """id of a new folder, or with merge of the folder that already has that name"""
+    try:
+        return client.folders.create_folder(name, CreateFolderParent(parent_id)).id
+    except BoxAPIError as err:
+        if err.response_info.body.get("code", None) != "item_name_in_use":
+            raise
+        conflict = err.response_info.body["context_info"]["conflicts"][0]
+        if not merge or conflict["type"] != "folder":
+            raise ValueError(f"Folder {parent_id} already has an item named {name!r}") from err
+        return conflict["id"]
+
+
+def _create_root(client: Client, source_id: str, name: str, parent_id: str, merge: bool) -> str:
+    """the target folder of a copy or move, never the source itself"""
+    folder_id = _create_folder(client, name, parent_id, merge)
+    if folder_id == source_id:
+        raise ValueError(f"Folder {source_id} cannot be merged into itself")
+    return folder_id
+
+
+def _walk(client: Client, folder_id: str, max_workers: int) -> List[FolderListing]:
+    return list(walk_folder_tree(client, folder_id, max_workers=max_workers, on_error=skip_missing_folders))
+
+
+def _delete_item(client: Client, item) -> None:
+    """non recursive delete, items already gone count as deleted"""
+    try:
+        if item.type == "folder":
+            client.folders.delete_folder_by_id(item.id)
+        elif item.type == "file":
+            client.files.delete_file_by_id(item.id)
+        else:
+            client.web_links.delete_web_link_by_id(item.id)
+    except BoxAPIError as err:
+        if err.response_info.body.get("code", None) not in ("not_found", "trashed"):
+            raise
+
+
+def _copy_item(client: Client, item, parent_id: str) -> Optional[str]:
+    """id of the copy, None when the target already has a file of that name"""
+    try:
+        return client.files.copy_file(item.id, CopyFileParent(parent_id)).id
+    except BoxAPIError as err:
+        if err.response_info.body.get("code", None) == "item_name_in_use":
+            logging.warning(" %s already exists in folder %s, not copied", item.name, parent_id)
+            return None
+        raise
+
+
+def _move_item(client: Client, item, parent_id: str) -> str:
+    if item.type == "file":
+        return client.files.update_file_by_id(item.id, parent=UpdateFileByIdParent(id=parent_id)).id
+    return client.web_links.update_web_link_by_id(item.id, parent=UpdateWebLinkByIdParent(id=parent_id)).id
+
+
+def _delete_task(client: Client, item, after: List[str]) -> TreeTask:
+    return TreeTask(f"delete:{item.id}", lambda results: _delete_item(client, item), after)
+
+
+def _child_task(key: str, operation: Callable, client: Client, item, parent_key: str) -> TreeTask:
+    """task running operation(client, item, parent id) once the parent folder exists"""
+    return TreeTask(key, lambda results: operation(client, item, results[parent_key]), [parent_key])
+
+
+def _create_child(client: Client, item, parent_id: str) -> str:
+    return _create_folder(client, item.name, parent_id)
+
+
+def plan_delete(client: Client, folder_id: str, max_workers: int = DEFAULT_TREE_WORKERS) -> List[TreeTask]:
+    """delete every item, each folder once its content is gone"""
+
+    listings = _walk(client, folder_id, max_workers)
+    tasks = []
+    for listing in listings:
+        tasks.extend(_delete_task(client, item, []) for item in listing.items if item.type != "folder")
+    # a folder waits for its files and its subfolders
+    children = {listing.folder_id: [f"delete:{item.id}" for item in listing.items] for listing in listings}
+    for listing in listings:
+        for folder in listing.folders:
+            tasks.append(_delete_task(client, folder, children.get(folder.id, [])))
+    root = client.folders.get_folder_by_id(folder_id, fields=["name"])
+    tasks.append(_delete_task(client, root, children[folder_id]))
+    return tasks
+
+
+def plan_copy(
+    client: Client,
+    folder_id: str,
+    target_parent_id: str,
+    name: Optional[str] = None,
+    max_workers: int = DEFAULT_TREE_WORKERS,
+    merge: bool = False,
+) -> List[TreeTask]:
+    """recreate the folders top down and copy every file into them
+
+    The root task fails when the target already has an item of that name,
+    unless merge copies into the existing folder. Web links cannot be copied
+    by the API and are left out.
+    """
+
+    listings = _walk(client, folder_id, max_workers)
+    root = client.folders.get_folder_by_id(folder_id, fields=["name"])
+    tasks = [
+        TreeTask(
+            f"folder:{folder_id}",
+            lambda results: _create_root(client, folder_id, name or root.name, target_parent_id, merge),
+            [],
+        )
+    ]
+    for listing in listings:
+        parent_key = f"folder:{listing.folder_id}"
+        for item in listing.items:
+            if item.type == "folder":
+                tasks.append(_child_task(f"folder:{item.id}", _create_child, client, item, parent_key))
+            elif item.type == "file":
+                tasks.append(_child_task(f"file:{item.id}", _copy_item, client, item, parent_key))
+            else:
+                logging.warning(" Web link %s cannot be copied, skipping it", item.name)
+    return tasks
+
+
+def plan_move(
+    client: Client,
+    folder_id: str,
+    target_parent_id: str,
+    name: Optional[str] = None,
+    max_workers: int = DEFAULT_TREE_WORKERS,
+) -> List[TreeTask]:
+    """merge a tree into the target, keeping file ids, then drop the emptied folders
+
+    Folders are recreated, so they get new ids and lose their collaborations,
+    shared links and metadata. move_tree only uses this plan when the target
+    already has a folder of that name.
+    """
+
+    listings = _walk(client, folder_id, max_workers)
+    root = client.folders.get_folder_by_id(folder_id, fields=["name"])
+    tasks = [
+        TreeTask(
+            f"folder:{folder_id}",
+            lambda results: _create_root(client, folder_id, name or root.name, target_parent_id, True),
+            [],
+        )
+    ]
+    # a source folder is deleted once its content moved and its target exists
+    children: Dict[str, List[str]] = {}
+    for listing in listings:
+        parent_key = f"folder:{listing.folder_id}"
+        keys = children.setdefault(listing.folder_id, [parent_key])
+        for item in listing.items:
+            if item.type == "folder":
+                tasks.append(_child_task(f"folder:{item.id}", _create_child, client, item, parent_key))
+                keys.append(f"delete:{item.id}")
+            else:
+                tasks.append(_child_task(f"move:{item.id}", _move_item, client, item, parent_key))
+                keys.append(f"move:{item.id}")
+
+    for listing in listings:
+        for folder in listing.folders:
+            tasks.append(_delete_task(client, folder, children.get(folder.id, [f"folder:{folder.id}"])))
+    tasks.append(_delete_task(client, root, children[folder_id]))
+    return tasks
+
+
+def delete_tree(
+    client: Client,
+    folder_id: str,
+    checkpoint_path: Optional[str] = None,
+    max_workers: int = DEFAULT_TREE_WORKERS,
+) -> TreeOpResult:
+    """delete a folder tree concurrently, with progress and resume"""
+    tasks = plan_delete(client, folder_id, max_workers)
+    return run_plan(tasks, TreeCheckpoint(checkpoint_path, f"delete:{folder_id}"), max_workers)
+
+
+def copy_tree(
+    client: Client,
+    folder_id: str,
+    target_parent_id: str,
+    name: Optional[str] = None,
+    checkpoint_path: Optional[str] = None,
+    max_workers: int = DEFAULT_TREE_WORKERS,
+    merge: bool = False,
+) -> TreeOpResult:
+    """copy a folder tree concurrently, results["folder:<id>"] is the new root id
+
+    Fails when the target already has an item of that name, unless merge.
+    """
+    tasks = plan_copy(client, folder_id, target_parent_id, name, max_workers, merge)
+    plan_id = f"copy:{folder_id}:{target_parent_id}:{name}"
+    return run_plan(tasks, TreeCheckpoint(checkpoint_path, plan_id), max_workers)
+
+
+def move_tree(
+    client: Client,
+    folder_id: str,
+    target_parent_id: str,
+    name: Optional[str] = None,
+    checkpoint_path: Optional[str] = None,
+    max_workers: int = DEFAULT_TREE_WORKERS,
+) -> TreeOpResult:
+    """move a folder tree into the target
+
+    A single update_folder_by_id request, which keeps the folder ids and
+    everything attached to them. Only when the target already has a folder
+    of that name is the tree merged into it, concurrently and with resume.
+    """
+    try:
+        client.folders.update_folder_by_id(folder_id, name=name, parent=UpdateFolderByIdParent(id=target_parent_id))
+    except BoxAPIError as err:
+        if err.response_info.body.get("code", None) != "item_name_in_use":
+            raise
+        logging.info(" Target already has a folder of that name, merging folder %s into it", folder_id)
+    else:
+        result = TreeOpResult(1)
+        result.done = 1
+        result.results[f"folder:{folder_id}"] = folder_id
+        logging.info(" Moved folder %s to folder %s", folder_id, target_parent_id)
+        return result
+
+    tasks = plan_move(client, folder_id, target_parent_id, name, max_workers)
+    plan_id = f"move:{folder_id}:{target_parent_id}:{name}"
+    return run_plan(tasks, TreeCheckpoint(checkpoint_path, plan_id), max_workers)
@@ -1,80 +1,790 @@
+import base64
+import hashlib
+import io
+import json
 import pathlib
 import os
 import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 from box_sdk_gen.client import BoxClient as Client
-from box_sdk_gen.schemas import Folder, File, Files
+from box_sdk_gen.schemas import Folder, File, FileMini, Files, FolderMini, UploadPart, UploadSession, WebLinkMini
+from box_sdk_gen.managers.files import CopyFileParent
 from box_sdk_gen.managers.folders import CreateFolderParent
 from box_sdk_gen.managers.uploads import (
     PreflightFileUploadCheckParent,
     UploadFileAttributes,
     UploadFileAttributesParentField,
 )
-from box_sdk_gen import BoxAPIError
+from box_sdk_gen import BoxAPIError, BoxSDKError
+
+from utils.box_listing import iter_folder_items
+from utils.box_state import ItemResult, JsonManifest, write_json_atomic
+from utils.box_throttle import BANDWIDTH_LIMITER, Priority
 
 logging.getLogger(__name__)
 
+DEFAULT_MAX_WORKERS = 8
+
+# box requires at least 20MB for upload sessions and recommends them above 50MB
+CHUNKED_UPLOAD_THRESHOLD = 50 * 1024 * 1024
+DEFAULT_PART_WORKERS = 4
+UPLOAD_JOURNAL_DIR = ".box_upload_journal"
+HASH_BUFFER_SIZE = 1024 * 1024
+DEFAULT_UPLOAD_MEMORY_BUDGET = 256 * 1024 * 1024
+# below this size a failed upload costs about as much as a preflight check
+PREFLIGHT_THRESHOLD = CHUNKED_UPLOAD_THRESHOLD
+# smaller files are cheaper to upload than to look up and copy
+COPY_DEDUP_THRESHOLD = 1024 * 1024
+
+
+class UploadResult(ItemResult):
+    """outcome of a single item in a folder upload"""
+
+    def __init__(
+        self,
+        local_path: str,
+        file: Optional[File] = None,
+        error: Optional[Exception] = None,
+        skipped: bool = False,
+    ) -> None:
+        super().__init__(local_path, error)
+        self.file = file
+        self.skipped = skipped
+
+    def _describe(self) -> str:
+        return "skipped" if self.skipped else f"file_id={self.file.id}"
+
+
+class SyncManifest(JsonManifest):
+    """local record of the size, mtime and sha1 of the files in a synced folder
+
+    Lets a sync skip re-hashing local files that did not change since the
+    last run. Keys are paths relative to the local base folder.
+    """
+
+    def sha1(self, rel_path: str, local_path: str) -> str:
+        """sha1 of a local file, hashing it only if size or mtime changed"""
+        stat = os.stat(local_path)
+        entry = self.get(rel_path)
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return entry["sha1"]
+
+        sha1 = file_sha1(local_path)
+        self.set(rel_path, {"size": stat.st_size, "mtime": stat.st_mtime, "sha1": sha1})
+        return sha1
+
+
+def file_sha1(file_path: str) -> str:
+    """hex sha1 of a local file"""
+
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as file:
+        for buffer in iter(lambda: file.read(HASH_BUFFER_SIZE), b""):
+            sha1.update(buffer)
+    return sha1.hexdigest()
+
+
+class FolderCache:
+    """per run cache of box folders keyed by (parent id, casefolded name)
+
+    Filled from folder listings and folder creations, so create_box_folder
+    can return known folders without any request. Box names are case
+    insensitive, so "Docs" finds a cached "docs".
+    """
+
+    def __init__(self) -> None:
+        self._folders: Dict[Tuple[str, str], Union[Folder, FolderMini]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, parent_id: str, name: str) -> Optional[Union[Folder, FolderMini]]:
+        with self._lock:
+            return self._folders.get((parent_id, name.casefold()))
+
+    def add(self, parent_id: str, folder: Union[Folder, FolderMini]) -> None:
+        with self._lock:
+            self._folders[(parent_id, folder.name.casefold())] = folder
 
-def create_box_folder(client: Client, folder_name: str, parent_folder: Folder) -> Folder:
-    """create a folder in box"""
+    def add_listing(self, parent_id: str, items: Iterable[Union[FileMini, FolderMini, WebLinkMini]]) -> None:
+        """cache the subfolders found in a folder listing"""
+        with self._lock:
+            for item in items:
+                if item.type == "folder":
+                    self._folders[(parent_id, item.name.casefold())] = item
 
+    def discard(self, parent_id: str, name: str) -> None:
+        """forget a folder, e.g. after it was deleted or renamed"""
+        with self._lock:
+            self._folders.pop((parent_id, name.casefold()), None)
+
+
+class Sha1Index:
+    """sha1 -> id of files known to exist in box
+
+    Lets uploads copy content box already has instead of sending the bytes.
+    """
+
+    def __init__(self) -> None:
+        self._files: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, sha1: str) -> Optional[str]:
+        with self._lock:
+            return self._files.get(sha1)
+
+    def add(self, sha1: Optional[str], file_id: str) -> None:
+        if sha1:
+            with self._lock:
+                self._files.setdefault(sha1, file_id)
+
+    def discard(self, sha1: str) -> None:
+        with self._lock:
+            self._files.pop(sha1, None)
+
+    def add_listing(self, items: Iterable[Union[FileMini, FolderMini, WebLinkMini]]) -> None:
+        """index the files found in a folder listing"""
+        for item in items:
+            if item.type == "file":
+                self.add(getattr(item, "sha_1", None), item.id)
+
+    def add_folder_tree(self, client: Client, folder_id: str) -> None:
+        """index every file under a box folder"""
+        folder_ids = [folder_id]
+        while folder_ids:
+            items = _list_folder_index(client, folder_ids.pop()).values()
+            self.add_listing(items)
+            folder_ids.extend(item.id for item in items if item.type == "folder")
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+
+def _list_folder_index(
+    client: Client,
+    folder_id: str,
+    folder_cache: Optional[FolderCache] = None,
+    fields: Optional[List[str]] = None,
+) -> Dict[str, Union[FileMini, FolderMini, WebLinkMini]]:
+    """casefolded name -> item for every item in a box folder, with the sha1 of files
+
+    Box names are case insensitive, look items up with name.casefold().
+    """
+
+    items = iter_folder_items(client, folder_id, fields=fields or ["name", "sha1"])
+    index = {item.name.casefold(): item for item in items}
+
+    if folder_cache is not None:
+        folder_cache.add_listing(folder_id, index.values())
+    return index
+
+
+def create_box_folder(
+    client: Client,
+    folder_name: str,
+    parent_folder: Folder,
+    folder_cache: Optional[FolderCache] = None,
+) -> Folder:
+    """create a folder in box
+
+    With a folder_cache, known folders are returned without a request and an
+    existing folder is taken from the conflict details instead of fetched.
+    """
+    return _create_or_get_folder(client, folder_name, parent_folder, folder_cache)[0]
+
+
+def _create_or_get_folder(
+    client: Client,
+    folder_name: str,
+    parent_folder: Folder,
+    folder_cache: Optional[FolderCache] = None,
+) -> Tuple[Folder, bool]:
+    """create_box_folder, also telling whether the folder was created, and so is empty"""
+
+    if folder_cache is not None:
+        folder = folder_cache.get(parent_folder.id, folder_name)
+        if folder is not None:
+            return folder, False
+
+    created = True
     try:
         folder = client.folders.create_folder(folder_name, CreateFolderParent(id=parent_folder.id))
     except BoxAPIError as err:
         if err.response_info.body.get("code", None) == "item_name_in_use":
-            folder_id = err.response_info.body["context_info"]["conflicts"][0]["id"]
-            folder = client.folders.get_folder_by_id(folder_id)
+            created = False
+            conflict = err.response_info.body["context_info"]["conflicts"][0]
+            if folder_cache is not None:
+                folder = Folder.from_dict(conflict)
+            else:
+                folder = client.folders.get_folder_by_id(conflict["id"])
         else:
             raise err
 
+    if folder_cache is not None:
+        folder_cache.add(parent_folder.id, folder)
     logging.info("Folder %s with id: %s", folder.name, folder.id)
-    return folder
+    return folder, created
 
 
 def folder_upload(
     client: Client,
     box_base_folder: Folder,
     local_folder_path: str,
+    folder_cache: Optional[FolderCache] = None,
 ) -> Folder:
-    """upload a folder to box"""
+    """upload a folder to box
+
+    Each box folder is listed once, so existing files are detected without a
+    preflight request per file. Subfolders found in the listings go into the
+    folder_cache, a new one per call unless given, so existing folders are
+    neither created nor fetched and folders created by the upload are not
+    listed.
+    """
+
+    folder_cache = folder_cache if folder_cache is not None else FolderCache()
+    folder_index = _list_folder_index(client, box_base_folder.id, folder_cache)
+    _folder_upload(client, box_base_folder, pathlib.Path(local_folder_path), folder_index, folder_cache)
+    return box_base_folder
 
-    local_folder = pathlib.Path(local_folder_path)
+
+def _folder_upload(
+    client: Client,
+    box_folder: Folder,
+    local_folder: pathlib.Path,
+    folder_index: Dict[str, Union[FileMini, FolderMini, WebLinkMini]],
+    folder_cache: FolderCache,
+) -> None:
+    """upload the children of a local folder into its listed box folder"""
 
     for item in local_folder.iterdir():
         if item.is_dir():
-            new_box_folder = create_box_folder(client, item.name, box_base_folder)
+            new_box_folder, created = _create_or_get_folder(client, item.name, box_folder, folder_cache)
             logging.info(" Folder %s", item.name)
-            folder_upload(client, new_box_folder, str(item))
+            new_index = {} if created else _list_folder_index(client, new_box_folder.id, folder_cache)
+            _folder_upload(client, new_box_folder, item, new_index, folder_cache)
         else:
-            file = file_upload(client, str(item), box_base_folder)
+            file = file_upload(client, str(item), box_folder, folder_index, priority=Priority.BULK)
             logging.info(" \tUploaded %s (%s) %s bytes", file.name, file.id, file.size)
 
-    return box_base_folder
 
+def folder_upload_concurrent(
+    client: Client,
+    box_base_folder: Folder,
+    local_folder_path: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    manifest_path: Optional[str] = None,
+    folder_cache: Optional[FolderCache] = None,
+    sha1_index: Optional[Sha1Index] = None,
+) -> List[UploadResult]:
+    """upload a folder to box using a bounded pool of workers
 
-def file_upload(client: Client, file_path: str, folder: Folder) -> File:
-    """upload a file to box"""
+    A box folder is always created before any of its children are submitted,
+    while sibling files and sibling subfolders are processed concurrently.
+    Failures are recorded in the results and do not stop the upload.
+
+    Each box folder is listed once, so existing files are detected without a
+    preflight request per file. With a manifest_path the upload runs as an
+    incremental sync: local files whose sha1 matches the remote file are
+    skipped. The manifest caches local hashes between runs.
+
+    Subfolders found in the listings go into the folder_cache, so existing
+    folders are neither created nor listed twice. Files found in the listings
+    go into the sha1_index, if given, so content already in box is copied
+    instead of uploaded.
+    """
+
+    local_base = pathlib.Path(local_folder_path)
+    manifest = SyncManifest(manifest_path) if manifest_path else None
+    folder_cache = folder_cache if folder_cache is not None else FolderCache()
+    results: List[UploadResult] = []
+
+    def list_folder(folder_id: str) -> Dict:
+        index = _list_folder_index(client, folder_id, folder_cache)
+        if sha1_index is not None:
+            sha1_index.add_listing(index.values())
+        return index
+
+    def prepare_folder(folder_name: str, parent_folder: Folder) -> Tuple[Folder, Dict]:
+        box_folder, created = _create_or_get_folder(client, folder_name, parent_folder, folder_cache)
+        # only a folder this upload created is known to be empty
+        return box_folder, {} if created else list_folder(box_folder.id)
+
+    def sync_file(item: pathlib.Path, box_folder: Folder, remote_index: Dict) -> Optional[File]:
+        sha1 = None
+        if manifest is not None:
+            remote = remote_index.get(item.name.casefold())
+            sha1 = manifest.sha1(item.relative_to(local_base).as_posix(), str(item))
+            if remote is not None and getattr(remote, "sha_1", None) == sha1:
+                return None
+        return file_upload(client, str(item), box_folder, remote_index, sha1_index, sha1, Priority.BULK)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # future -> (is_folder, local path)
+        pending: Dict[Future, Tuple[bool, pathlib.Path]] = {}
+
+        def submit_children(box_folder: Folder, remote_index: Dict, local_folder: pathlib.Path):
+            try:
+                children = list(local_folder.iterdir())
+            except OSError as err:
+                results.append(UploadResult(str(local_folder), error=err))
+                return
+            for item in children:
+                if item.is_dir():
+                    future = executor.submit(prepare_folder, item.name, box_folder)
+                    pending[future] = (True, item)
+                else:
+                    future = executor.submit(sync_file, item, box_folder, remote_index)
+                    pending[future] = (False, item)
+
+        submit_children(box_base_folder, list_folder(box_base_folder.id), local_base)
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    is_folder, item = pending.pop(future)
+                    try:
+                        box_item = future.result()
+                    except (BoxSDKError, OSError, ValueError, KeyError) as err:
+                        logging.error(" Failed %s: %s", item, err)
+                        results.append(UploadResult(str(item), error=err))
+                        continue
+                    if is_folder:
+                        logging.info(" Folder %s", item.name)
+                        submit_children(*box_item, item)
+                    elif box_item is None:
+                        logging.info(" \tUnchanged %s", item.name)
+                        results.append(UploadResult(str(item), skipped=True))
+                    else:
+                        logging.info(" \tUploaded %s (%s) %s bytes", box_item.name, box_item.id, box_item.size)
+                        results.append(UploadResult(str(item), file=box_item))
+        finally:
+            if manifest is not None:
+                manifest.save()
+
+    return results
+
+
+def _preflight_conflict_id(client: Client, file_name: str, file_size: int, folder_id: str) -> Optional[str]:
+    """run an upload preflight check, returning the id of a conflicting file"""
 
-    file_size = os.path.getsize(file_path)
-    file_name = os.path.basename(file_path)
-    file_id = None
     try:
-        pre_flight_arg = PreflightFileUploadCheckParent(id=folder.id)
+        pre_flight_arg = PreflightFileUploadCheckParent(id=folder_id)
         client.uploads.preflight_file_upload_check(name=file_name, size=file_size, parent=pre_flight_arg)
     except BoxAPIError as err:
         if err.response_info.body.get("code", None) == "item_name_in_use":
-            file_id = err.response_info.body["context_info"]["conflicts"]["id"]
-        else:
-            raise err
+            return err.response_info.body["context_info"]["conflicts"]["id"]
+        raise err
+    return None
+
+
+def file_upload(
+    client: Client,
+    file_path: str,
+    folder: Folder,
+    folder_index: Optional[Dict[str, Union[FileMini, FolderMini, WebLinkMini]]] = None,
+    sha1_index: Optional[Sha1Index] = None,
+    sha1: Optional[str] = None,
+    priority: Priority = Priority.INTERACTIVE,
+) -> File:
+    """upload a file to box
+
+    With a folder_index (casefolded name -> item, see _list_folder_index) the choice
+    between a new file and a new version is made locally, and the preflight
+    check only runs for new files at or above PREFLIGHT_THRESHOLD.
+
+    With a sha1_index, a new file whose content already exists in box is
+    copied server side instead of uploaded. The local sha1 is computed unless
+    given.
+
+    The transfer is throttled by the process bandwidth limiter at priority.
+    """
+
+    file_size = os.path.getsize(file_path)
+    file_name = os.path.basename(file_path)
+    if folder_index is None:
+        file_id = _preflight_conflict_id(client, file_name, file_size, folder.id)
+    else:
+        existing = folder_index.get(file_name.casefold())
+        file_id = existing.id if existing is not None and existing.type == "file" else None
+        if file_id is None and file_size >= PREFLIGHT_THRESHOLD:
+            file_id = _preflight_conflict_id(client, file_name, file_size, folder.id)
+
+    if sha1_index is not None and file_id is None and file_size >= COPY_DEDUP_THRESHOLD:
+        sha1 = sha1 or file_sha1(file_path)
+        file = _copy_known_content(client, sha1_index, sha1, file_name, folder.id)
+        if file is not None:
+            return file
+
+    if file_size >= CHUNKED_UPLOAD_THRESHOLD:
+        file = chunked_upload(client, file_path, folder.id, file_id, priority=priority)
+        if sha1_index is not None:
+            sha1_index.add(file.sha_1, file.id)
+        return file
 
     upload_arg = UploadFileAttributes(file_name, UploadFileAttributesParentField(folder.id))
     if file_id is None:
         # upload new file
-        files: Files = client.uploads.upload_file(upload_arg, file=open(file_path, "rb"))
-        file = files.entries[0]
+        try:
+            file = _stream_upload(client, file_path, upload_arg, priority=priority)
+        except BoxAPIError as err:
+            # the folder index can be stale, fall back to a new version
+            if folder_index is None or err.response_info.body.get("code", None) != "item_name_in_use":
+                raise err
+            file_id = err.response_info.body["context_info"]["conflicts"]["id"]
+            file = _stream_upload(client, file_path, upload_arg, file_id, priority)
     else:
         # upload new version
-        files: Files = client.uploads.upload_file_version(file_id, upload_arg, file=open(file_path, "rb"))
-        file = files.entries[0]
+        file = _stream_upload(client, file_path, upload_arg, file_id, priority)
+
+    if sha1_index is not None:
+        sha1_index.add(file.sha_1, file.id)
+    return file
+
+
+def _copy_known_content(
+    client: Client, sha1_index: Sha1Index, sha1: str, file_name: str, folder_id: str
+) -> Optional[File]:
+    """copy a box file with the same content into the folder, if there is one"""
+
+    source_id = sha1_index.get(sha1)
+    if source_id is None:
+        return None
+    try:
+        file = client.files.copy_file(source_id, CopyFileParent(folder_id), name=file_name)
+    except BoxAPIError as err:
+        code = err.response_info.body.get("code", None)
+        if code in ("not_found", "trashed"):
+            # the indexed file is gone, forget it and upload the bytes
+            sha1_index.discard(sha1)
+            return None
+        if code == "item_name_in_use":
+            return None
+        raise err
+    logging.info(" \tCopied %s from file %s instead of uploading", file_name, source_id)
+    return file
+
+
+class HashingFileReader:
+    """read only file stream that sha1 hashes the bytes as they are read
 
+    A read never returns more than buffer_size bytes, so the SDK streams the
+    file through a fixed size buffer. Reads are throttled by the process
+    bandwidth limiter. Use it as a context manager to close the file handle
+    deterministically.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        buffer_size: int = HASH_BUFFER_SIZE,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> None:
+        self._file = open(file_path, "rb")
+        self.buffer_size = buffer_size
+        self.priority = priority
+        self.sha1 = hashlib.sha1()
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self.buffer_size:
+            size = self.buffer_size
+        buffer = self._file.read(size)
+        BANDWIDTH_LIMITER.consume(len(buffer), self.priority)
+        self.sha1.update(buffer)
+        return buffer
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        # a rewind, e.g. for a retry, restarts the hash
+        position = self._file.seek(offset, whence)
+        if position == 0:
+            self.sha1 = hashlib.sha1()
+        return position
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "HashingFileReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _stream_upload(
+    client: Client,
+    file_path: str,
+    upload_arg: UploadFileAttributes,
+    file_id: Optional[str] = None,
+    priority: Priority = Priority.INTERACTIVE,
+) -> File:
+    """upload a file, or a new version of it, in a single streamed request"""
+
+    with HashingFileReader(file_path, priority=priority) as stream:
+        if file_id is None:
+            files: Files = client.uploads.upload_file(upload_arg, file=stream)
+        else:
+            files: Files = client.uploads.upload_file_version(file_id, upload_arg, file=stream)
+        local_sha1 = stream.sha1.hexdigest()
+
+    file = files.entries[0]
+    if file.sha_1 is not None and file.sha_1 != local_sha1:
+        logging.warning(" %s changed while it was being uploaded", file_path)
     return file
+
+
+class MemoryBudget:
+    """process wide limit on the bytes held in upload part buffers"""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.used = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int) -> int:
+        """block until size bytes are available, returns the amount held"""
+        size = min(size, self.capacity)
+        with self._condition:
+            while self.used + size > self.capacity:
+                self._condition.wait()
+            self.used += size
+        return size
+
+    def release(self, size: int) -> None:
+        with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+
+UPLOAD_MEMORY_BUDGET = MemoryBudget(DEFAULT_UPLOAD_MEMORY_BUDGET)
+
+
+def _sha1_digest(sha1) -> str:
+    """RFC3230 digest header value for a sha1 hash object"""
+    return "sha=" + base64.b64encode(sha1.digest()).decode()
+
+
+class UploadJournal:
+    """on disk record of an upload session, used to resume chunked uploads
+
+    The journal is keyed by the local file and the destination, and is only
+    valid while the local file keeps the same size and modification time.
+    """
+
+    def __init__(self, journal_dir: str, file_path: str, folder_id: str, file_id: Optional[str] = None) -> None:
+        stat = os.stat(file_path)
+        key = f"{os.path.abspath(file_path)}|{folder_id}|{file_id or ''}"
+        self.path = os.path.join(journal_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+        self.file_path = os.path.abspath(file_path)
+        self.file_size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.session_id: Optional[str] = None
+        self.endpoints: Dict[str, str] = {}
+        self.parts: Dict[int, UploadPart] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> bool:
+        """load a previous journal for the same file contents"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as journal_file:
+                data = json.load(journal_file)
+        except (OSError, ValueError):
+            return False
+        if data.get("file_size") != self.file_size or data.get("mtime") != self.mtime:
+            return False
+        self.session_id = data["session_id"]
+        self.endpoints = data["endpoints"]
+        self.parts = {part["offset"]: UploadPart.from_dict(part) for part in data["parts"]}
+        return True
+
+    def start(self, session: UploadSession) -> None:
+        self.session_id = session.id
+        self.endpoints = session.session_endpoints.to_dict()
+        self.parts = {}
+        self.save()
+
+    def add_part(self, part: UploadPart) -> None:
+        with self._lock:
+            self.parts[part.offset] = part
+            self.save()
+
+    def save(self) -> None:
+        """atomically replace the journal file"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {
+            "file_path": self.file_path,
+            "file_size": self.file_size,
+            "mtime": self.mtime,
+            "session_id": self.session_id,
+            "endpoints": self.endpoints,
+            "parts": [part.to_dict() for part in self.parts.values()],
+        }
+        write_json_atomic(self.path, data)
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _resume_upload_session(client: Client, journal: UploadJournal) -> Optional[UploadSession]:
+    """query a journaled session and return it with the parts box already has"""
+
+    try:
+        session: UploadSession = client.chunked_uploads.get_file_upload_session_by_url(journal.endpoints["status"])
+        parts: Dict[int, UploadPart] = {}
+        offset = 0
+        while True:
+            page = client.chunked_uploads.get_file_upload_session_parts_by_url(
+                journal.endpoints["list_parts"], offset=offset, limit=1000
+            )
+            for part in page.entries or []:
+                parts[part.offset] = part
+            offset += len(page.entries or [])
+            if not page.entries or offset >= page.total_count:
+                break
+    except BoxAPIError as err:
+        logging.info(" Upload session %s can not be resumed: %s", journal.session_id, err.response_info.code)
+        return None
+
+    # box is the source of truth, the journal only tells us which session to ask
+    journal.parts = parts
+    journal.save()
+    return session
+
+
+def chunked_upload(
+    client: Client,
+    file_path: str,
+    folder_id: str,
+    file_id: Optional[str] = None,
+    max_workers: int = DEFAULT_PART_WORKERS,
+    journal_dir: Optional[str] = UPLOAD_JOURNAL_DIR,
+    memory_budget: Optional[MemoryBudget] = None,
+    priority: Priority = Priority.INTERACTIVE,
+) -> File:
+    """upload a large file to box using an upload session with parallel parts
+
+    The file is read sequentially, hashing each part and the whole file as it
+    streams, while up to max_workers parts are uploaded concurrently.
+    Passing a file_id uploads a new version of that file.
+
+    Progress is journaled in journal_dir, so a failed upload leaves its session
+    open and the next call for the same file only sends the missing parts.
+    Set journal_dir to None to abort the session on failure instead.
+
+    Part buffers are taken from memory_budget, shared by every chunked upload
+    in the process unless another budget is given. Parts are throttled by
+    the process bandwidth limiter at priority.
+    """
+
+    file_size = os.path.getsize(file_path)
+    file_name = os.path.basename(file_path)
+
+    journal = UploadJournal(journal_dir, file_path, folder_id, file_id) if journal_dir else None
+    session: Optional[UploadSession] = None
+    if journal is not None and journal.load():
+        session = _resume_upload_session(client, journal)
+        if session is not None:
+            logging.info(" Resuming upload of %s, %s parts already uploaded", file_name, len(journal.parts))
+
+    if session is None:
+        if file_id is None:
+            session = client.chunked_uploads.create_file_upload_session(folder_id, file_size, file_name)
+        else:
+            session = client.chunked_uploads.create_file_upload_session_for_existing_file(
+                file_id, file_size, file_name=file_name
+            )
+        if journal is not None:
+            journal.start(session)
+    endpoints = session.session_endpoints
+    uploaded_parts: Dict[int, UploadPart] = dict(journal.parts) if journal is not None else {}
+
+    # bounds the number of parts in flight for this file, the memory budget
+    # bounds the part buffers held by all uploads together
+    in_flight = threading.BoundedSemaphore(max_workers)
+    memory_budget = memory_budget if memory_budget is not None else UPLOAD_MEMORY_BUDGET
+    errors: List[BaseException] = []
+
+    def release(held: int) -> None:
+        memory_budget.release(held)
+        in_flight.release()
+
+    def upload_part(buffer: bytes, offset: int, digest: str, held: int) -> UploadPart:
+        try:
+            content_range = f"bytes {offset}-{offset + len(buffer) - 1}/{file_size}"
+            BANDWIDTH_LIMITER.consume(len(buffer), priority)
+            uploaded = client.chunked_uploads.upload_file_part_by_url(
+                endpoints.upload_part, io.BytesIO(buffer), digest, content_range
+            )
+            if journal is not None:
+                journal.add_part(uploaded.part)
+            return uploaded.part
+        except BaseException as err:
+            errors.append(err)
+            raise
+        finally:
+            release(held)
+
+    file_hash = hashlib.sha1()
+    parts: List[UploadPart] = []
+    futures: List[Future] = []
+    try:
+        with open(file_path, "rb") as file, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            offset = 0
+            while offset < file_size and not errors:
+                in_flight.acquire()
+                try:
+                    held = memory_budget.acquire(session.part_size)
+                except BaseException:
+                    in_flight.release()
+                    raise
+                # the buffer goes back to the shared budget unless a worker took it over
+                submitted = False
+                try:
+                    buffer = file.read(session.part_size)
+                    if not buffer or errors:
+                        break
+                    file_hash.update(buffer)
+                    part_hash = hashlib.sha1(buffer)
+                    uploaded_part = uploaded_parts.get(offset)
+                    if uploaded_part is not None and uploaded_part.sha_1 == part_hash.hexdigest():
+                        parts.append(uploaded_part)
+                    else:
+                        future = executor.submit(upload_part, buffer, offset, _sha1_digest(part_hash), held)
+                        submitted = True
+                        futures.append(future)
+                    offset += len(buffer)
+                    del buffer
+                finally:
+                    if not submitted:
+                        release(held)
+        parts.extend(future.result() for future in futures)
+    except BaseException:
+        if journal is not None:
+            logging.error(" Upload of %s interrupted, session %s kept for resume", file_name, session.id)
+            raise
+        logging.error(" Aborting upload session %s for %s", session.id, file_name)
+        try:
+            client.chunked_uploads.delete_file_upload_session_by_url(endpoints.abort)
+        except BoxAPIError as err:
+            logging.warning(" Failed to abort upload session %s: %s", session.id, err)
+        raise
+
+    parts.sort(key=lambda part: part.offset)
+    files: Files = client.chunked_uploads.create_file_upload_session_commit_by_url(
+        endpoints.commit, parts, _sha1_digest(file_hash)
+    )
+    if journal is not None:
+        journal.remove()
+    return files.entries[0]
@@ -0,0 +1,374 @@
+"""
+Streaming extraction and sharding of box zip downloads
+entries are unpacked from the local file headers as the zip arrives,
+large selections are split over several concurrent zip downloads
+"""
+
+import fnmatch
+import logging
+import os
+import pathlib
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, List, Optional, Union
+
+from box_sdk_gen.client import BoxClient as Client
+from box_sdk_gen.managers.zip_downloads import CreateZipDownloadItems
+from box_sdk_gen.schemas import FileMini, FolderMini
+
+from utils.box_throttle import BANDWIDTH_LIMITER, COPY_BUFFER_SIZE, Priority, copy_stream
+
+logging.getLogger(__name__)
+
+LOCAL_HEADER_SIGNATURE = 0x04034B50
+CENTRAL_HEADER_SIGNATURE = 0x02014B50
+END_OF_CENTRAL_DIRECTORY_SIGNATURE = 0x06054B50
+DATA_DESCRIPTOR_SIGNATURE = 0x08074B50
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_MARKER = 0xFFFFFFFF
+FLAG_ENCRYPTED = 0x1
+FLAG_DATA_DESCRIPTOR = 0x8
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+# box refuses zip downloads above these limits
+ZIP_MAX_BYTES = 32 * 1024 * 1024 * 1024
+ZIP_MAX_ITEMS = 10000
+DEFAULT_SHARD_BYTES = 4 * 1024 * 1024 * 1024
+DEFAULT_ZIP_WORKERS = 4
+PROGRESS_INTERVAL = 2.0
+
+
+class _StreamReader:
+    """throttled reads from a stream with a push back buffer"""
+
+    def __init__(self, stream: BinaryIO, priority: Priority, on_read: Optional[Callable[[int], None]] = None) -> None:
+        self.stream = stream
+        self.priority = priority
+        self.on_read = on_read
+        self._buffer = b""
+
+    def read(self, size: int = COPY_BUFFER_SIZE) -> bytes:
+        """up to size bytes, empty at the end of the stream"""
+        if not self._buffer:
+            data = self.stream.read(COPY_BUFFER_SIZE)
+            BANDWIDTH_LIMITER.consume(len(data), self.priority)
+            if self.on_read:
+                self.on_read(len(data))
+            self._buffer = data
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def read_exact(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self.read(size - len(data))
+            if not chunk:
+                raise ValueError("Zip stream ended inside an entry")
+            data += chunk
+        return data
+
+    def unread(self, data: bytes) -> None:
+        self._buffer = data + self._buffer
+
+    def peek(self, size: int) -> bytes:
+        """up to size bytes, left in place for the next read"""
+        data = b""
+        while len(data) < size:
+            chunk = self.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        self.unread(data)
+        return data
+
+
+def _zip64_sizes(extra: bytes, compressed_size: int, size: int):
+    """sizes from the zip64 extra field when the header only has markers"""
+    while len(extra) >= 4:
+        field_id, field_size = struct.unpack("<HH", extra[:4])
+        if field_id == ZIP64_EXTRA_ID:
+            values = list(struct.unpack(f"<{field_size // 8}Q", extra[4 : 4 + field_size - field_size % 8]))
+            if size == ZIP64_MARKER:
+                size = values.pop(0)
+            if compressed_size == ZIP64_MARKER:
+                compressed_size = values.pop(0)
+            return compressed_size, size, True
+        extra = extra[4 + field_size :]
+    return compressed_size, size, False
+
+
+def _empty_descriptor(zip64: bool) -> bytes:
+    """a signed data descriptor for an entry without data"""
+    return struct.pack("<I", DATA_DESCRIPTOR_SIGNATURE) + bytes(20 if zip64 else 12)
+
+
+def _safe_path(target_dir: pathlib.Path, name: str) -> pathlib.Path:
+    """the local path of an entry, refusing names that leave target_dir"""
+    parts = pathlib.PurePosixPath(name.replace("\\", "/")).parts
+    if not parts or parts[0] == "/" or ".." in parts or ":" in parts[0]:
+        raise ValueError(f"Refusing to extract zip entry outside the target folder: {name}")
+    return target_dir.joinpath(*parts)
+
+
+def extract_zip_stream(
+    stream: BinaryIO,
+    target_dir: str,
+    pattern: Optional[str] = None,
+    priority: Priority = Priority.BULK,
+    on_read: Optional[Callable[[int], None]] = None,
+) -> List[str]:
+    """extract a zip from a forward only stream into target_dir
+
+    Entries are written as they arrive, only one read buffer is held at a
+    time. Entries whose name does not match the glob pattern are read past
+    without being written. Returns the paths of the extracted files.
+    """
+
+    target = pathlib.Path(target_dir)
+    target.mkdir(parents=True, exist_ok=True)
+    reader = _StreamReader(stream, priority, on_read)
+    extracted: List[str] = []
+
+    while True:
+        signature_bytes = reader.read_exact(4)
+        (signature,) = struct.unpack("<I", signature_bytes)
+        if signature in (CENTRAL_HEADER_SIGNATURE, END_OF_CENTRAL_DIRECTORY_SIGNATURE):
+            # the central directory only repeats what the local headers said
+            break
+        if signature != LOCAL_HEADER_SIGNATURE:
+            raise ValueError(f"Unexpected zip record signature {signature:#x}")
+
+        (
+            _,
+            _,
+            flags,
+            method,
+            _,
+            _,
+            crc,
+            compressed_size,
+            size,
+            name_length,
+            extra_length,
+        ) = LOCAL_HEADER.unpack(signature_bytes + reader.read_exact(LOCAL_HEADER.size - 4))
+        name = reader.read_exact(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+        compressed_size, size, zip64 = _zip64_sizes(reader.read_exact(extra_length), compressed_size, size)
+
+        if flags & FLAG_ENCRYPTED:
+            raise ValueError(f"Encrypted zip entry {name} is not supported")
+        if method not in (METHOD_STORED, METHOD_DEFLATED):
+            raise ValueError(f"Zip entry {name} uses unsupported compression method {method}")
+        has_descriptor = bool(flags & FLAG_DATA_DESCRIPTOR)
+        is_dir = name.endswith("/")
+        if has_descriptor and method == METHOD_STORED:
+            # stored data does not mark its own end, only directories and
+            # empty files, whose descriptor follows the header, can be read
+            empty = _empty_descriptor(zip64)
+            if not is_dir and reader.peek(len(empty)) != empty:
+                raise ValueError(f"Stored zip entry {name} without sizes cannot be streamed")
+            compressed_size = 0
+
+        local_path = _safe_path(target, name)
+        wanted = not is_dir and (pattern is None or fnmatch.fnmatch(name, pattern))
+        if is_dir:
+            local_path.mkdir(parents=True, exist_ok=True)
+
+        output = None
+        if wanted:
+            local_path.parent.mkdir(parents=True, exist_ok=True)
+            output = open(local_path, "wb")
+        try:
+            entry_crc = 0
+            if method == METHOD_DEFLATED:
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                remaining = None if has_descriptor else compressed_size
+                while not decompressor.eof:
+                    chunk = reader.read(COPY_BUFFER_SIZE if remaining is None else min(remaining, COPY_BUFFER_SIZE))
+                    if not chunk:
+                        raise ValueError(f"Zip stream ended inside entry {name}")
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    data = decompressor.decompress(chunk)
+                    entry_crc = zlib.crc32(data, entry_crc)
+                    if output:
+                        output.write(data)
+                # deflate knows where it ends, give back what belongs to the next record
+                reader.unread(decompressor.unused_data)
+            else:
+                remaining = compressed_size
+                while remaining:
+                    data = reader.read(min(remaining, COPY_BUFFER_SIZE))
+                    if not data:
+                        raise ValueError(f"Zip stream ended inside entry {name}")
+                    remaining -= len(data)
+                    entry_crc = zlib.crc32(data, entry_crc)
+                    if output:
+                        output.write(data)
+        except BaseException:
+            if output:
+                output.close()
+                os.remove(local_path)
+            raise
+        if output:
+            output.close()
+
+        if has_descriptor:
+            descriptor = reader.read_exact(4)
+            if struct.unpack("<I", descriptor)[0] == DATA_DESCRIPTOR_SIGNATURE:
+                descriptor = reader.read_exact(4)
+            (crc,) = struct.unpack("<I", descriptor)
+            descriptor_sizes = struct.unpack("<QQ" if zip64 else "<II", reader.read_exact(16 if zip64 else 8))
+            if method == METHOD_STORED and descriptor_sizes != (0, 0):
+                raise ValueError(f"Stored zip entry {name} without sizes cannot be streamed")
+
+        if entry_crc != crc:
+            if output:
+                os.remove(local_path)
+            raise ValueError(f"Zip entry {name} failed its crc check")
+        if output:
+            extracted.append(str(local_path))
+            logging.info(" Extracted %s", name)
+
+    return extracted
+
+
+def shard_items(
+    items: List[Union[FileMini, FolderMini]],
+    max_shard_bytes: int = DEFAULT_SHARD_BYTES,
+    max_shard_items: int = ZIP_MAX_ITEMS,
+) -> List[List[Union[FileMini, FolderMini]]]:
+    """split items with a size into size balanced shards
+
+    Starts with as few shards as the limits allow, and places the largest
+    items first, each on the lightest shard it still fits in. An item that
+    fits in no shard opens a new one, an item above max_shard_bytes gets a
+    shard of its own.
+    """
+
+    total = sum(item.size or 0 for item in items)
+    count = max(-(-total // max_shard_bytes), -(-len(items) // max_shard_items), 1)
+    shards: List[List[Union[FileMini, FolderMini]]] = [[] for _ in range(count)]
+    sizes = [0] * count
+    for item in sorted(items, key=lambda item: item.size or 0, reverse=True):
+        size = item.size or 0
+        index = min(
+            (
+                index
+                for index in range(len(shards))
+                if len(shards[index]) < max_shard_items and sizes[index] + size <= max_shard_bytes
+            ),
+            key=lambda index: sizes[index],
+            default=None,
+        )
+        if index is None:
+            shards.append([])
+            sizes.append(0)
+            index = len(shards) - 1
+        shards[index].append(item)
+        sizes[index] += size
+    return [shard for shard in shards if shard]
+
+
+class ZipProgress:
+    """aggregate progress of concurrent zip downloads
+
+    Byte counts are compressed bytes received against the uncompressed size
+    of the items, so the percentage is an estimate.
+    """
+
+    def __init__(self, total_bytes: int, total_shards: int, interval: float = PROGRESS_INTERVAL) -> None:
+        self.total_bytes = total_bytes
+        self.total_shards = total_shards
+        self.bytes_received = 0
+        self.shards_done = 0
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last_report = 0.0
+
+    def add(self, size: int) -> None:
+        with self._lock:
+            self.bytes_received += size
+            now = time.monotonic()
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+        self.report()
+
+    def shard_done(self) -> None:
+        with self._lock:
+            self.shards_done += 1
+        self.report()
+
+    def report(self) -> None:
+        percent = 100 * self.bytes_received / self.total_bytes if self.total_bytes else 100
+        logging.info(
+            " Zip download %s of %s shards, %s bytes (~%.0f%%)",
+            self.shards_done,
+            self.total_shards,
+            self.bytes_received,
+            min(percent, 100),
+        )
+
+
+class _CountingWriter:
+    """file wrapper reporting the bytes written to a progress"""
+
+    def __init__(self, target: BinaryIO, progress: ZipProgress) -> None:
+        self.target = target
+        self.progress = progress
+
+    def write(self, data: bytes) -> int:
+        self.progress.add(len(data))
+        return self.target.write(data)
+
+
+def download_zip_sharded(
+    client: Client,
+    items: List[Union[FileMini, FolderMini]],
+    target_dir: str,
+    download_file_name: str = "box_download",
+    max_shard_bytes: int = DEFAULT_SHARD_BYTES,
+    max_workers: int = DEFAULT_ZIP_WORKERS,
+    merge: bool = False,
+    progress: Optional[ZipProgress] = None,
+) -> List[str]:
+    """download items as several size balanced zip downloads at once
+
+    Items need their size, list them with the size field. Without merge
+    every shard is saved as download_file_name_NNN.zip in target_dir,
+    with merge the shards are extracted into target_dir as they stream.
+    Returns the zip paths, or the extracted file paths when merging.
+    """
+
+    too_large = [item.id for item in items if (item.size or 0) > ZIP_MAX_BYTES]
+    if too_large:
+        raise ValueError(f"Items {', '.join(too_large)} are larger than a box zip download allows")
+    shards = shard_items(items, min(max_shard_bytes, ZIP_MAX_BYTES))
+    progress = progress or ZipProgress(sum(item.size or 0 for item in items), len(shards))
+    pathlib.Path(target_dir).mkdir(parents=True, exist_ok=True)
+    logging.info(" Downloading %s items as %s zip shards", len(items), len(shards))
+
+    def download_shard(index: int, shard: List[Union[FileMini, FolderMini]]) -> List[str]:
+        shard_name = f"{download_file_name}_{index:03}.zip"
+        zip_items = [CreateZipDownloadItems(type=item.type, id=item.id) for item in shard]
+        zip_download = client.zip_downloads.create_zip_download(zip_items, download_file_name=shard_name)
+        stream = client.zip_downloads.get_zip_download_content(zip_download.download_url)
+
+        if merge:
+            paths = extract_zip_stream(stream, target_dir, on_read=progress.add)
+        else:
+            zip_path = os.path.join(target_dir, shard_name)
+            with open(zip_path, "wb") as zip_file:
+                copy_stream(stream, _CountingWriter(zip_file, progress), Priority.BULK)
+            paths = [zip_path]
+        progress.shard_done()
+        return paths
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(download_shard, index, shard) for index, shard in enumerate(shards)]
+        return [path for future in futures for path in future.result()]
@@ -3,7 +3,8 @@
 import logging
 
 from box_sdk_gen.client import BoxClient as Client
-from utils.box_utils import create_box_folder, folder_upload
+from utils.box_paths import ROOT_FOLDER
+from utils.box_utils import FolderCache, create_box_folder, folder_upload
 
 
 logging.getLogger(__name__)
@@ -11,11 +12,10 @@ logging.getLogger(__name__)
 
 def create_samples(client: Client):
     """Uploads sample content to Box."""
-    wks_folder = create_box_folder(
-        client, "workshops", client.folders.get_folder_by_id("0")
-    )
+    folder_cache = FolderCache()
+    wks_folder = create_box_folder(client, "workshops", ROOT_FOLDER, folder_cache)
 
-    comments_folder = create_box_folder(client, "comments", wks_folder)
+    comments_folder = create_box_folder(client, "comments", wks_folder, folder_cache)
     folder_upload(
-        client, comments_folder, "workshops/comments/content_samples/"
+        client, comments_folder, "workshops/comments/content_samples/", folder_cache
     )
@@ -17,6 +17,7 @@ from box_sdk_gen.schemas import (
 from box_sdk_gen.managers.files import GetFileThumbnailByIdExtension
 
 from utils.box_client_oauth import ConfigOAuth, get_client_oauth
+from utils.box_listing import iter_folder_items
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("box_sdk_gen").setLevel(logging.CRITICAL)
@@ -118,7 +119,7 @@ def file_thumbnail(
 def folder_list_representation_status(
     client: Client, folder: Folder, representation: str
 ):
-    items = client.folders.get_folder_items(folder.id).entries
+    items = iter_folder_items(client, folder.id)
     print(
         f"\nChecking for {representation} ",
         f"status in folder [{folder.name}] ({folder.id})",
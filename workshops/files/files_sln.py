@@ -4,11 +4,17 @@ import datetime
 import logging
 import os
 from typing import List
-import shutil
 import json
 
 from box_sdk_gen import BoxAPIError
 from utils.box_client_oauth import ConfigOAuth, get_client_oauth
+from utils.box_utils import CHUNKED_UPLOAD_THRESHOLD, HashingFileReader, chunked_upload
+from utils.box_throttle import Priority, copy_stream
+from utils.box_download import download_file_segmented
+from utils.box_cache import DownloadCache
+from utils.box_zip import download_zip_sharded, extract_zip_stream
+from utils.box_listing import iter_folder_items
+from utils.box_fields import profile_fields
 from box_sdk_gen.client import BoxClient as Client
 from box_sdk_gen.schemas import File, Files
 from box_sdk_gen.managers.files import CopyFileParent
@@ -40,23 +46,29 @@ def upload_file(client: Client, file_path: str, folder_id: str) -> File:
         client.uploads.preflight_file_upload_check(name=file_name, size=file_size, parent=pre_flight_arg)
 
         # upload new file
-        upload_arg = UploadFileAttributes(file_name, UploadFileAttributesParentField(folder_id))
-        files: Files = client.uploads.upload_file(upload_arg, file=open(file_path, "rb"))
+        if file_size >= CHUNKED_UPLOAD_THRESHOLD:
+            # large files go through an upload session with parallel parts
+            box_file = chunked_upload(client, file_path, folder_id)
+        else:
+            upload_arg = UploadFileAttributes(file_name, UploadFileAttributesParentField(folder_id))
+            with HashingFileReader(file_path) as file:
+                files: Files = client.uploads.upload_file(upload_arg, file=file)
 
-        box_file = files.entries[0]
+            box_file = files.entries[0]
     except BoxAPIError as err:
         if err.response_info.body.get("code", None) == "item_name_in_use":
             logging.warning("File already exists, updating contents")
             box_file_id = err.response_info.body["context_info"]["conflicts"]["id"]
             try:
                 # upload new version
-
-                upload_arg = UploadFileAttributes(file_name, UploadFileAttributesParentField(folder_id))
-                files: Files = client.uploads.upload_file_version(
-                    box_file_id, upload_arg, file=open(file_path, "rb")
-                )
-
-                box_file = files.entries[0]
+                if file_size >= CHUNKED_UPLOAD_THRESHOLD:
+                    box_file = chunked_upload(client, file_path, folder_id, box_file_id)
+                else:
+                    upload_arg = UploadFileAttributes(file_name, UploadFileAttributesParentField(folder_id))
+                    with HashingFileReader(file_path) as file:
+                        files: Files = client.uploads.upload_file_version(box_file_id, upload_arg, file=file)
+
+                    box_file = files.entries[0]
             except BoxAPIError as err2:
                 logging.error("Failed to update %s: %s", box_file.name, err2)
                 raise err2
@@ -66,33 +78,72 @@ def upload_file(client: Client, file_path: str, folder_id: str) -> File:
     return box_file
 
 
-def download_file(client: Client, file_id: str, local_path_to_file: str):
+def download_file(
+    client: Client,
+    file_id: str,
+    local_path_to_file: str,
+    max_workers: int = 1,
+    resumable: bool = False,
+    cache: DownloadCache = None,
+):
     """Download a file from Box"""
+    if cache is not None:
+        # repeated downloads of an unchanged file are served from the local cache
+        cache.download(client, file_id, local_path_to_file)
+        return
+
+    if max_workers > 1 or resumable:
+        # fetch byte ranges over several connections, resuming any previous attempt
+        download_file_segmented(client, file_id, local_path_to_file, max_workers)
+        return
+
     file_stream: ByteStream = client.downloads.download_file(file_id)
 
     with open(local_path_to_file, "wb") as file:
-        shutil.copyfileobj(file_stream, file)
+        copy_stream(file_stream, file)
 
 
 def download_zip(
     client: Client,
     local_path_to_zip: str,
     items: List[CreateZipDownloadItems],
+    extract_to: str = None,
+    pattern: str = None,
 ):
-    """Download a zip file from Box"""
+    """Download a zip file from Box
+
+    With extract_to the zip is not written to disk, its entries matching the
+    optional glob pattern are extracted into that folder as they arrive.
+    """
 
     file_name = os.path.basename(local_path_to_zip)
     zip_download = client.zip_downloads.create_zip_download(items, download_file_name=file_name)
 
     file_stream: ByteStream = client.zip_downloads.get_zip_download_content(zip_download.download_url)
 
+    if extract_to is not None:
+        return extract_zip_stream(file_stream, extract_to, pattern)
+
     with open(local_path_to_zip, "wb") as file:
-        shutil.copyfileobj(file_stream, file)
+        copy_stream(file_stream, file, Priority.BULK)
+
+
+def download_folder_zip_sharded(
+    client: Client,
+    folder_id: str,
+    local_dir: str,
+    max_workers: int = 4,
+    merge: bool = False,
+) -> List[str]:
+    """Download the contents of a folder as several zip files at once"""
+
+    items = list(iter_folder_items(client, folder_id, fields=["name", "size"]))
+    return download_zip_sharded(client, items, local_dir, max_workers=max_workers, merge=merge)
 
 
-def file_to_json(client: Client, file_id: str) -> str:
-    """Get a file from Box"""
-    file: File = client.files.get_file_by_id(file_id)
+def file_to_json(client: Client, file_id: str, profile: str = "full") -> str:
+    """Get a file from Box, with the fields of a field profile"""
+    file: File = client.files.get_file_by_id(file_id, fields=profile_fields(profile))
     file_json = json.dumps(file.to_dict(), indent=2)
     return file_json
 
@@ -101,11 +152,10 @@ def file_update_description(client: Client, file_id: str, description: str) -> F
     return client.files.update_file_by_id(file_id, description=description)
 
 
-def folder_list_contents(client: Client, folder_id: str):
-    folder = client.folders.get_folder_by_id(folder_id)
-    items = client.folders.get_folder_items(folder_id)
+def folder_list_contents(client: Client, folder_id: str, profile: str = "listing"):
+    folder = client.folders.get_folder_by_id(folder_id, fields=["name"])
     print(f"\nFolder [{folder.name}] content:")
-    for item in items.entries:
+    for item in iter_folder_items(client, folder_id, fields=profile_fields(profile), prefetch=True):
         print(f"   {item.type.value} {item.id} {item.name}")
 
 
@@ -139,7 +189,7 @@ def main():
 
     zip_items_arg = []
 
-    for item in client.folders.get_folder_items(user_root.id).entries:
+    for item in iter_folder_items(client, user_root.id):
         item_arg = CreateZipDownloadItems(type=item.type, id=item.id)
         zip_items_arg.append(item_arg)
 
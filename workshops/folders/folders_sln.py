@@ -1,13 +1,18 @@
 """Box Folder workshop"""
 
 import logging
-from typing import Union
+from typing import Iterable, Iterator, Union
 
 from box_sdk_gen import BoxAPIError
 from utils.box_client_oauth import ConfigOAuth, get_client_oauth
 from box_sdk_gen.client import BoxClient as Client
 from box_sdk_gen.schemas import Folder, FolderMini, FileMini, WebLinkMini
-from box_sdk_gen.managers.folders import Items, CreateFolderParent
+from box_sdk_gen.managers.folders import CreateFolderParent
+from utils.box_utils import FolderCache
+from utils.box_listing import iter_folder_items, walk_folder_tree
+from utils.box_paths import PathResolver
+from utils.box_fields import profile_fields
+from utils.box_tree_ops import delete_tree
 
 
 logging.basicConfig(level=logging.INFO)
@@ -22,56 +27,60 @@ def print_box_item(box_item: Union[FileMini, FolderMini, WebLinkMini], level: in
     )
 
 
-def print_box_items(box_items: Items):
+def print_box_items(box_items: Iterable[Union[FileMini, FolderMini, WebLinkMini]]):
     """Print items"""
     print("--- Items ---")
-    for box_item in box_items.entries:
+    for box_item in box_items:
         print_box_item(box_item)
     print("-------------")
 
 
-def get_folder_items(box_client: Client, box_folder_id: str = "0") -> Items:
-    """Get folder items"""
-    return box_client.folders.get_folder_items(folder_id=box_folder_id)
+def get_folder_items(
+    box_client: Client, box_folder_id: str = "0", profile: str = "listing"
+) -> Iterator[Union[FileMini, FolderMini, WebLinkMini]]:
+    """Get folder items, every page of them"""
+    return iter_folder_items(box_client, box_folder_id, fields=profile_fields(profile))
 
 
-def print_folder_items_recursive(box_client: Client, folder_id: str, level: int = 0):
-    """Get folder items recursively"""
-    folder = box_client.folders.get_folder_by_id(folder_id)
-    print_box_item(folder, level)
-    box_items = get_folder_items(box_client, folder.id)
-    for box_item in box_items.entries:
-        if box_item.type == "folder":
-            print_folder_items_recursive(box_client, box_item.id, level + 1)
-        else:
-            print_box_item(box_item, level + 1)
+def print_folder_items_recursive(box_client: Client, folder_id: str, level: int = 0, max_workers: int = 8):
+    """Get folder items recursively
+
+    The tree is listed concurrently, then printed depth first from memory.
+    """
+    listings = {
+        listing.folder_id: listing.items
+        for listing in walk_folder_tree(box_client, folder_id, max_workers=max_workers)
+    }
+
+    def print_listing(box_folder_id: str, level: int):
+        for box_item in listings[box_folder_id]:
+            print_box_item(box_item, level)
+            if box_item.type == "folder":
+                print_listing(box_item.id, level + 1)
+
+    print_box_item(box_client.folders.get_folder_by_id(folder_id, fields=["name"]), level)
+    print_listing(folder_id, level + 1)
 
 
-def get_workshop_folder(box_client: Client) -> Folder:
+def get_workshop_folder(box_client: Client, resolver: PathResolver = None) -> Folder:
     """Get workshop folder"""
-    # root = box_client.folder(folder_id="0").get()
-    workshops_folder_list = [
-        box_item
-        for box_item in box_client.folders.get_folder_items("0").entries
-        if box_item.name == "workshops" and box_item.type == "folder"
-    ]
-    if workshops_folder_list == []:
-        raise ValueError("'Workshop' folder not found")
-
-    folders_folder_list = [
-        box_item
-        for box_item in box_client.folders.get_folder_items(workshops_folder_list[0].id).entries
-        if box_item.name == "folders" and box_item.type == "folder"
-    ]
-    if folders_folder_list == []:
-        raise ValueError("'Folders' folder not found")
-
-    return folders_folder_list[0]
-
-
-def create_box_folder(box_client: Client, folder_name: str, parent_folder: Folder) -> Folder:
+    resolver = resolver or PathResolver(box_client)
+    return resolver.get("/workshops/folders")
+
+
+def create_box_folder(
+    box_client: Client,
+    folder_name: str,
+    parent_folder: Folder,
+    folder_cache: FolderCache = None,
+) -> Folder:
     """create a folder in box"""
 
+    if folder_cache is not None:
+        folder = folder_cache.get(parent_folder.id, folder_name)
+        if folder is not None:
+            return folder
+
     try:
         parent_arg = CreateFolderParent(parent_folder.id)
         folder = box_client.folders.create_folder(
@@ -80,11 +89,18 @@ def create_box_folder(box_client: Client, folder_name: str, parent_folder: Folde
         )
     except BoxAPIError as box_err:
         if box_err.response_info.body.get("code", None) == "item_name_in_use":
-            box_folder_id = box_err.response_info.body["context_info"]["conflicts"][0]["id"]
-            folder = box_client.folders.get_folder_by_id(box_folder_id)
+            conflict = box_err.response_info.body["context_info"]["conflicts"][0]
+            if folder_cache is not None:
+                # the conflict already tells us what we need
+                folder = Folder.from_dict(conflict)
+            else:
+                folder = box_client.folders.get_folder_by_id(conflict["id"])
         else:
             raise box_err
 
+    if folder_cache is not None:
+        folder_cache.add(parent_folder.id, folder)
+
     # logging.info("Folder %s with id: %s", folder.name, folder.id)
     return folder
 
@@ -109,11 +125,12 @@ def main():
     print_box_item(workshop_folder)
 
     # Create folders
-    my_documents = create_box_folder(client, "my_documents", workshop_folder)
-    work = create_box_folder(client, "work", my_documents)
+    folder_cache = FolderCache()
+    my_documents = create_box_folder(client, "my_documents", workshop_folder, folder_cache)
+    work = create_box_folder(client, "work", my_documents, folder_cache)
 
-    downloads = create_box_folder(client, "downloads", workshop_folder)
-    personal = create_box_folder(client, "personal", downloads)
+    downloads = create_box_folder(client, "downloads", workshop_folder, folder_cache)
+    personal = create_box_folder(client, "personal", downloads, folder_cache)
 
     print_folder_items_recursive(client, workshop_folder.id)
 
@@ -143,8 +160,8 @@ def main():
     print(f"Description: {downloads.description}")
 
     # Delete a folder
-    tmp = create_box_folder(client, "tmp", downloads)
-    tmp2 = create_box_folder(client, "tmp2", tmp)
+    tmp = create_box_folder(client, "tmp", downloads, folder_cache)
+    tmp2 = create_box_folder(client, "tmp2", tmp, folder_cache)
 
     print("--- Before the delete ---")
     print_folder_items_recursive(client, downloads.id)
@@ -156,12 +173,12 @@ def main():
         if err.response_info.body.get("code", None) == "folder_not_empty":
             logging.info(f"Folder {tmp.name} is not empty, deleting recursively")
             # print(f"Folder {tmp.name} is not empty, deleting recursively")
-            try:
-                client.folders.delete_folder_by_id(tmp.id, recursive=True)
-            except BoxAPIError as err_l2:
-                raise err_l2
+            result = delete_tree(client, tmp.id)
+            if not result.ok:
+                raise ValueError(f"Failed to delete folder {tmp.name}: {result}")
         else:
             raise err
+    folder_cache.discard(downloads.id, tmp.name)
 
     print("--- After the delete ---")
     print_folder_items_recursive(client, downloads.id)
@@ -170,6 +187,7 @@ def main():
     # Rename folder
     print("Renaming personal downloads to games")
     games = client.folders.update_folder_by_id(personal.id, name="games")
+    folder_cache.discard(downloads.id, personal.name)
     print_folder_items_recursive(client, downloads.id)
     print("---")
 
@@ -4,15 +4,17 @@ import logging
 
 from box_sdk_gen.client import BoxClient as Client
 
-from utils.box_utils import create_box_folder, folder_upload
+from utils.box_paths import ROOT_FOLDER
+from utils.box_utils import FolderCache, create_box_folder, folder_upload
 
 logging.getLogger(__name__)
 
 
 def create_samples(client: Client):
     """Uploads sample content to Box."""
-    wks_folder = create_box_folder(client, "workshops", client.folders.get_folder_by_id("0"))
+    folder_cache = FolderCache()
+    wks_folder = create_box_folder(client, "workshops", ROOT_FOLDER, folder_cache)
 
-    docs_folder = create_box_folder(client, "intelligence", wks_folder)
+    docs_folder = create_box_folder(client, "intelligence", wks_folder, folder_cache)
 
-    folder_upload(client, docs_folder, "workshops/intelligence/content_samples/")
+    folder_upload(client, docs_folder, "workshops/intelligence/content_samples/", folder_cache)
@@ -22,6 +22,7 @@ from box_sdk_gen import (
 
 from utils.box_ai_client_oauth import BoxAIClient, ConfigOAuth, get_ai_client_oauth
 from utils.intelligence import ExtractStructuredMetadataTemplate
+from utils.box_listing import iter_folder_items
 
 logging.getLogger("box_sdk_gen").setLevel(logging.CRITICAL)
 
@@ -308,8 +309,7 @@ def main():
         )
 
     # # Scan the purchase folder for metadata suggestions
-    folder_items = client.folders.get_folder_items(PO_FOLDER)
-    for item in folder_items.entries:
+    for item in iter_folder_items(client, PO_FOLDER):
         print(f"\nItem: {item.name} [{item.id}]")
         ai_response = get_metadata_suggestions_for_file(client, item.id, ENTERPRISE_SCOPE, template_key)
         print(f"Suggestions: {ai_response.answer}")
@@ -322,8 +322,8 @@ def main():
         )
 
     # # Scan the invoice folder for metadata suggestions
-    folder_items = client.folders.get_folder_items(INVOICE_FOLDER)
-    for item in folder_items.entries:
+    folder_items = list(iter_folder_items(client, INVOICE_FOLDER))
+    for item in folder_items:
         print(f"\nItem: {item.name} [{item.id}]")
         ai_response = get_metadata_suggestions_for_file(client, item.id, ENTERPRISE_SCOPE, template_key)
         print(f"Suggestions: {ai_response.answer}")
@@ -336,7 +336,7 @@ def main():
         )
 
     # get metadata for a file
-    metadata = get_file_metadata(client, folder_items.entries[0].id, template_key)
+    metadata = get_file_metadata(client, folder_items[0].id, template_key)
     print(f"\nMetadata for file: {metadata.extra_data}")
 
     # # search for invoices without purchase orders
@@ -3,7 +3,8 @@
 import logging
 
 from box_sdk_gen.client import BoxClient as Client
-from utils.box_utils import create_box_folder, folder_upload
+from utils.box_paths import ROOT_FOLDER
+from utils.box_utils import FolderCache, create_box_folder, folder_upload
 
 
 logging.getLogger(__name__)
@@ -11,10 +12,9 @@ logging.getLogger(__name__)
 
 def upload_content_sample(client: Client):
     """Uploads sample content to Box."""
-    wks_folder = create_box_folder(
-        client, "workshops", client.folders.get_folder_by_id("0")
-    )
+    folder_cache = FolderCache()
+    wks_folder = create_box_folder(client, "workshops", ROOT_FOLDER, folder_cache)
 
-    search_folder = create_box_folder(client, "search", wks_folder)
+    search_folder = create_box_folder(client, "search", wks_folder, folder_cache)
 
-    folder_upload(client, search_folder, "workshops/search/content_samples/")
+    folder_upload(client, search_folder, "workshops/search/content_samples/", folder_cache)
@@ -17,6 +17,7 @@ from box_sdk_gen.schemas import (
 from box_sdk_gen.managers.search import SearchForContentContentTypes
 
 from utils.box_client_oauth import ConfigOAuth, get_client_oauth
+from utils.box_fields import profile_fields
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("box_sdk_gen").setLevel(logging.CRITICAL)
@@ -43,6 +44,7 @@ def simple_search(
     content_types: List[SearchForContentContentTypes] = None,
     result_type: str = None,
     ancestor_folder_ids: List[str] = None,
+    profile: str = "listing",
 ) -> Union[SearchResults, SearchResultsWithSharedLinks]:
     """Search by query in any Box content"""
 
@@ -51,6 +53,7 @@ def simple_search(
         content_types=content_types,
         type=result_type,
         ancestor_folder_ids=ancestor_folder_ids,
+        fields=profile_fields(profile),
     )
 
 
@@ -115,7 +118,7 @@ def main():
     print_search_results(search_results)
 
     # Search banana
-    search_results = simple_search(client, "banana")
+    search_results = simple_search(client, "banana", profile="full")
 
     print("--- Search Results ---")
     for item in search_results.entries:
@@ -137,6 +140,7 @@ def main():
         "banana",
         ancestor_folder_ids=[folder_apple_banana.id, folder_banana_apple.id],
         result_type="file",
+        profile="full",
     )
 
     print("--- Search Results ---")